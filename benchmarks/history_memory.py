@@ -0,0 +1,114 @@
+# Memory and load time of the poll history for synthetic histories.
+#
+# usage: python benchmarks/history_memory.py [N ...]   (default: 10000 100000 1000000)
+#
+# every size is measured in a fresh interpreter: "dicts" is the plain json.load of the history
+# file (how entries used to be held), "table" is PollHistory, which keeps the polls in the
+# columns of a PollTable plus its thread/message indexes and the expiry heap.
+
+#region IMPORTS
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+#endregion
+
+#region GLOBALS
+
+SIZES = [10_000, 100_000, 1_000_000]
+SEED = 42
+SNOWFLAKE = 1_100_000_000_000_000_000 # roughly where 2024 discord ids start
+
+#endregion
+
+def make_history(n: int, f: str):
+
+    random.seed(SEED)
+    now = datetime.now().timestamp()
+    status = ["*APERTA*", "*CHIUSA*", "*ELIMINATA*"]
+
+    with open(f, "w") as fp:
+        fp.write("{")
+        for i in range(1, n+1):
+            entry = {
+                "timestamp": datetime.fromtimestamp(now-random.randint(0, 3*365*24*3600)).isoformat(),
+                "duration": float(random.choice([3600, 24*3600, 7*24*3600])),
+                "quorum": random.randint(0, 100),
+                "majority": random.randint(0, 100),
+                "channel": SNOWFLAKE+random.randint(0, 10**15),
+                "message": SNOWFLAKE+4*i,
+                "thread": SNOWFLAKE+4*i+1,
+                "status": status[0] if i>n-50 else random.choice(status[1:]),
+                "guild": SNOWFLAKE+random.randint(0, 10**15)
+            }
+            fp.write(("," if i>1 else "")+json.dumps(str(i))+":"+json.dumps(entry))
+        fp.write("}")
+
+def rss():
+
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])*1024
+
+def measure(mode: str, f: str):
+
+    if mode=="table":
+        from poll_history import PollHistory
+
+    before = rss()
+    start = time.perf_counter()
+    if mode=="table":
+        history = PollHistory(f)
+    else:
+        with open(f) as fp:
+            history = json.load(fp)
+    elapsed = time.perf_counter()-start
+    after = rss()
+
+    print(json.dumps({"load": elapsed, "rss": after-before, "n": len(history)}))
+
+def run(mode: str, f: str):
+
+    out = subprocess.run(
+        [sys.executable, __file__, "--measure", mode, f],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+
+    return json.loads(out.strip().splitlines()[-1])
+
+def main(sizes: list):
+
+    print(f"{'polls':>10} {'mode':>8} {'load (s)':>10} {'rss (MiB)':>10} {'bytes/poll':>11}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            f = os.path.join(tmp, f"poll_history_{n}.json")
+            make_history(n, f)
+
+            for mode in ["dicts", "table"]:
+                result = run(mode, f)
+                print(
+                    f"{n:>10} {mode:>8} {result['load']:>10.2f} "
+                    f"{result['rss']/1024**2:>10.1f} {result['rss']/n:>11.0f}"
+                )
+
+            os.remove(f)
+
+
+if __name__=="__main__":
+
+    if len(sys.argv)>1 and sys.argv[1]=="--measure":
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main([int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,104 @@
+# Time taken by /statistiche on synthetic histories.
+#
+# usage: python benchmarks/poll_stats.py [N ...]   (default: 10000 100000)
+#
+# every closed poll has a result snapshot and its voters in the ledger, drawn from a server
+# of MEMBERS members. "load" is PollColumns.load (the walk of the history and the sort of its
+# voters), "stats" is poll_stats over the columns it built, what a cached /statistiche costs.
+
+#region IMPORTS
+
+import os
+import sys
+import time
+import random
+import tempfile
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from poll_history import PollHistory, PollHistoryEntry, PollStatus, VoterLedger
+from poll_stats import PollColumns, poll_stats
+
+#endregion
+
+#region GLOBALS
+
+SIZES = [10_000, 100_000]
+SEED = 42
+MEMBERS = 200
+SNOWFLAKE = 1_100_000_000_000_000_000 # roughly where 2024 discord ids start
+
+#endregion
+
+def make_history(n: int, path: str):
+
+    random.seed(SEED)
+    now = int(time.time())
+    members = [SNOWFLAKE+i for i in range(MEMBERS)]
+
+    history = PollHistory(os.path.join(path, "poll_history.json"))
+    ledger = VoterLedger(os.path.join(path, "poll_voters.json"))
+
+    entries = []
+    for i in range(1, n+1):
+        status = PollStatus.OPEN if i>n-50 else random.choice([PollStatus.CLOSED, PollStatus.DELETED])
+        entry = PollHistoryEntry(
+            timestamp=now-random.randint(0, 3*365*24*3600),
+            duration=24*3600,
+            quorum=random.randint(0, 100),
+            majority=random.randint(0, 100),
+            channel=SNOWFLAKE,
+            message=SNOWFLAKE+4*i,
+            thread=SNOWFLAKE+4*i+1,
+            status=status
+        )
+
+        if status==PollStatus.CLOSED:
+            voters = random.sample(members, random.randint(0, MEMBERS))
+            answers = {}
+            for user in voters:
+                answers.setdefault(random.randrange(1, 6), array("Q")).append(user)
+
+            entry.results = {
+                "question": f"Votazione {i}",
+                "answers": [
+                    {"text": str(answer), "votes": len(answers.get(answer, [])), "majority": False}
+                    for answer in range(1, 6)
+                ],
+                "total": len(voters),
+                "eligible": MEMBERS,
+                "quorum": False,
+                "closed": entry.expires
+            }
+            ledger.polls[entry.message] = {"synced": now, "answers": answers}
+
+        entries.append((str(i), entry))
+
+    history.restore(entries)
+
+    return history, ledger, set(members)
+
+def main(sizes: list):
+
+    print(f"{'polls':>10} {'load (s)':>10} {'stats (s)':>10}")
+
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            history, ledger, members = make_history(n, tmp)
+
+            start = time.perf_counter()
+            columns = PollColumns.load(history, ledger)
+            loaded = time.perf_counter()
+            poll_stats(columns, members)
+            done = time.perf_counter()
+
+            print(f"{n:>10} {loaded-start:>10.3f} {done-loaded:>10.3f}")
+
+            history.close()
+            ledger.close()
+
+
+if __name__=="__main__":
+
+    main([int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,222 @@
+# Runs a bot as a cluster of worker processes, every worker connects a group of its shards.
+#
+# usage: python cluster.py powl_bot.py [--shards N] [--workers W]
+#
+# shards defaults to the number of workers, workers to the number of cores. the shards are
+# split in contiguous groups, a worker that exits is restarted with an increasing delay.
+# ctrl+c (or SIGTERM) stops the workers the way ctrl+c stops a single bot, so their state
+# is flushed before they exit
+
+#region IMPORTS
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+import subprocess
+from discord.ext import commands
+from persistence import FileLock
+
+#endregion
+
+#region GLOBALS
+
+SHARD_IDS = "CLUSTER_SHARD_IDS" # environment of a worker: its shards, comma separated
+SHARD_COUNT = "CLUSTER_SHARD_COUNT" # shards of the whole bot
+WORKER = "CLUSTER_WORKER" # index of the worker
+IDENTIFY_EVERY = 5.0 # seconds between two identifies of the same bot, whichever process sends them
+RESTART_DELAY = 5.0 # wait before restarting a worker that exited, doubled on every quick exit
+RESTART_MAX = 300.0
+STABLE_AFTER = 600.0 # a worker that ran this long is restarted with RESTART_DELAY again
+STOP_TIMEOUT = 30.0 # seconds a stopping worker has to flush its state before it is killed
+
+#endregion
+
+#region WORKER
+
+def shard_options():
+
+    # AutoShardedBot options of this process: the shards given by the launcher, or every
+    # shard discord recommends when the bot runs on its own
+    ids = os.environ.get(SHARD_IDS)
+    if not ids:
+        return {}
+
+    return {
+        "shard_ids": [int(id) for id in ids.split(",")],
+        "shard_count": int(os.environ[SHARD_COUNT])
+    }
+
+def log_file(f: str):
+
+    # workers rotating the same log would lose each other's lines
+    worker = os.environ.get(WORKER)
+    if worker is None:
+        return f
+
+    root, ext = os.path.splitext(f)
+
+    return f"{root}.{worker}{ext}"
+
+
+class ClusterBot(commands.AutoShardedBot):
+
+    # the shards of a bot, all of them or the group the launcher gave to this process. every
+    # guild belongs to a single shard, so the state of a guild is read and written by a single
+    # process; what the processes share goes through a FileLock. subclasses set self.path
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **(shard_options() | kwargs))
+
+    def shard_of(self, guild: int):
+
+        # before the first connection a lone bot doesn't know its shard count yet
+        return (guild >> 22)%(self.shard_count or 1)
+
+    def owns(self, guild: int):
+
+        # events and interactions of the other guilds never reach this process
+        if self.shard_ids is None:
+            return True
+
+        return self.shard_of(guild) in self.shard_ids
+
+    @property
+    def primary(self):
+
+        # the process that does what must happen once per bot, like syncing the commands
+        return self.shard_ids is None or 0 in self.shard_ids
+
+    async def before_identify_hook(self, shard_id: int | None, *, initial: bool=False):
+
+        # the identify limit is per bot: the shards of every process take turns
+        await asyncio.to_thread(self.identify_turn)
+
+    def identify_turn(self):
+
+        # the last identify of the bot is stamped in the lock file itself
+        with FileLock(f"{self.path}/identify.lock") as lock:
+            os.lseek(lock.fd, 0, os.SEEK_SET)
+            try:
+                last = float(os.read(lock.fd, 64) or 0)
+            except ValueError:
+                last = 0.0
+
+            wait = last+IDENTIFY_EVERY-time.time()
+            if wait>0:
+                time.sleep(wait)
+
+            os.ftruncate(lock.fd, 0)
+            os.lseek(lock.fd, 0, os.SEEK_SET)
+            os.write(lock.fd, str(time.time()).encode())
+
+#endregion
+
+#region LAUNCHER
+
+def shard_groups(shards: int, workers: int):
+
+    return [list(range(i*shards//workers, (i+1)*shards//workers)) for i in range(workers)]
+
+
+class Worker:
+
+    def __init__(self, script: str, index: int, shards: list, count: int) -> None:
+
+        self.script = script
+        self.index = index
+        self.shards = shards
+        self.count = count
+        self.process = None
+        self.started = None
+        self.delay = RESTART_DELAY
+        self.restart_at = None
+
+    def start(self):
+
+        env = os.environ | {
+            SHARD_IDS: ",".join(str(shard) for shard in self.shards),
+            SHARD_COUNT: str(self.count),
+            WORKER: str(self.index)
+        }
+
+        # a session of its own: ctrl+c reaches the launcher only, which stops the workers once
+        self.process = subprocess.Popen([sys.executable, self.script], env=env, start_new_session=True)
+        self.started = time.monotonic()
+        self.restart_at = None
+
+        print(f"WORKER {self.index} STARTED (shards {self.shards[0]}-{self.shards[-1]} of {self.count})")
+
+    def check(self):
+
+        if self.process.poll() is None:
+            return
+
+        now = time.monotonic()
+        if self.restart_at is None:
+            self.delay = RESTART_DELAY if now-self.started>=STABLE_AFTER else min(2*self.delay, RESTART_MAX)
+            self.restart_at = now+self.delay
+
+            print(f"WORKER {self.index} EXITED ({self.process.returncode}), RESTART IN {self.delay:.0f}s")
+        elif now>=self.restart_at:
+            self.start()
+
+    def stop(self):
+
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+
+    def join(self, timeout: float):
+
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def main(argv: list):
+
+    parser = argparse.ArgumentParser(description="Runs a bot over several processes.")
+    parser.add_argument("script", help="the bot, e.g. powl_bot.py")
+    parser.add_argument("--shards", type=int, default=None, help="shards of the bot")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    args = parser.parse_args(argv)
+
+    shards = args.shards or args.workers
+    workers = [
+        Worker(args.script, index, group, shards)
+        for index, group in enumerate(shard_groups(shards, min(args.workers, shards)))
+    ]
+
+    stopping = False
+    def stop(signum, frame):
+
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for worker in workers:
+        worker.start()
+
+    while not stopping:
+        time.sleep(1)
+        for worker in workers:
+            worker.check()
+
+    for worker in workers:
+        worker.stop()
+
+    deadline = time.monotonic()+STOP_TIMEOUT
+    for worker in workers:
+        worker.join(max(deadline-time.monotonic(), 0))
+
+#endregion
+
+if __name__=="__main__":
+
+    main(sys.argv[1:])
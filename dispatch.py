@@ -0,0 +1,202 @@
+#region IMPORTS
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from enum import IntEnum
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+#endregion
+
+#region GLOBALS
+
+DISPATCH_CONCURRENCY = 4 # requests in flight at once, what's left of the global limit goes to interactions
+SLOW_WAIT = 5.0 # requests queued longer than this are logged
+
+# (requests, seconds) allowed per route, same channel, same kind of request. these are the
+# limits discord usually answers with: staying below them means no 429s to wait out
+ROUTE_LIMITS = {
+    "message": (5, 5.0),
+    "thread": (2, 10.0),
+    "pin": (1, 1.0),
+    "delete": (5, 5.0),
+    "reaction": (1, 0.25)
+}
+
+logger = logging.getLogger("discord")
+
+#endregion
+
+#region DISPATCHER
+
+class Priority(IntEnum):
+
+    # lower goes first
+    INTERACTION = 0 # whatever a user is waiting for right now
+    MESSAGE = 1
+    PING = 2
+    PIN = 3
+    REACTION = 4
+
+
+class Dispatcher:
+
+    # outgoing writes of a bot go through a single queue: the most urgent request whose route
+    # has room in its bucket is sent next, requests on the same route keep their order.
+    # interaction responses (defer, send_message, edit_original_response) never go through
+    # here, they have 3 seconds to happen and their own webhook limits
+
+    def __init__(
+        self,
+        concurrency: int=DISPATCH_CONCURRENCY,
+        limits: dict=ROUTE_LIMITS
+    ) -> None:
+
+        self.concurrency = concurrency
+        self.limits = limits
+
+        self.queue = [] # heap of (priority, sequence, route, call, enqueued, future)
+        self.sequence = itertools.count()
+        self.buckets = {} # route -> start times of its recent requests
+        self.busy = set() # routes with a request in flight
+        self.inflight = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+        self.done = Counter() # priority -> requests sent
+        self.waits = {priority: deque(maxlen=100) for priority in Priority} # recent queue times
+
+    def submit(
+        self,
+        route: tuple[str, Hashable],
+        call: Callable[[], Awaitable[Any]],
+        priority: Priority=Priority.MESSAGE
+    ):
+
+        # route is (kind, channel id), call makes the request when invoked
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self.queue,
+            (priority, next(self.sequence), route, call, time.monotonic(), future)
+        )
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        self.wakeup.set()
+
+        return future
+
+    def send(self, messageable, priority: Priority=Priority.MESSAGE, **kwargs):
+
+        return self.submit(("message", messageable.id), lambda: messageable.send(**kwargs), priority)
+
+    def reply(self, message, priority: Priority=Priority.MESSAGE, **kwargs):
+
+        return self.submit(("message", message.channel.id), lambda: message.reply(**kwargs), priority)
+
+    def pin(self, message, priority: Priority=Priority.PIN):
+
+        return self.submit(("pin", message.channel.id), message.pin, priority)
+
+    def react(self, message, emoji: str, priority: Priority=Priority.REACTION):
+
+        return self.submit(
+            ("reaction", message.channel.id), lambda: message.add_reaction(emoji), priority
+        )
+
+    def ready_at(self, route: tuple, now: float):
+
+        limit = self.limits.get(route[0])
+        bucket = self.buckets.get(route)
+        if limit is None or bucket is None:
+            return now
+
+        requests, per = limit
+        while bucket and bucket[0]<=now-per:
+            bucket.popleft()
+
+        return now if len(bucket)<requests else bucket[0]+per
+
+    async def run(self):
+
+        while self.queue or self.inflight:
+            self.wakeup.clear()
+
+            now = time.monotonic()
+            delay = None
+            for item in sorted(self.queue):
+                if self.inflight>=self.concurrency:
+                    break
+
+                route = item[2]
+                if route in self.busy:
+                    continue
+
+                ready = self.ready_at(route, now)
+                if ready>now:
+                    delay = ready-now if delay is None else min(delay, ready-now)
+                    continue
+
+                self.queue.remove(item)
+                self.busy.add(route)
+                self.inflight += 1
+                self.buckets.setdefault(route, deque()).append(now)
+                asyncio.create_task(self.execute(item, now))
+
+            heapq.heapify(self.queue)
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def execute(self, item: tuple, started: float):
+
+        priority, _, route, call, enqueued, future = item
+
+        wait = started-enqueued
+        self.waits[priority].append(wait)
+        if wait>SLOW_WAIT:
+            logger.warning(f"{priority.name} request on {route} queued for {wait:.1f}s")
+
+        try:
+            if not future.cancelled():
+                future.set_result(await call())
+        except Exception as e:
+            if not future.cancelled():
+                future.set_exception(e)
+        finally:
+            self.done[priority] += 1
+            self.busy.discard(route)
+            self.inflight -= 1
+            self.wakeup.set()
+
+    def metrics(self):
+
+        depth = Counter(item[0].name for item in self.queue)
+
+        return {
+            "inflight": self.inflight,
+            "depth": {priority.name: depth[priority.name] for priority in Priority},
+            "done": {priority.name: self.done[priority] for priority in Priority},
+            "wait": {
+                priority.name: {
+                    "avg": sum(waits)/len(waits) if waits else 0.0,
+                    "max": max(waits, default=0.0)
+                } for priority, waits in self.waits.items()
+            }
+        }
+
+    def close(self):
+
+        if self.task is not None:
+            self.task.cancel()
+
+        for *_, future in self.queue:
+            future.cancel()
+        self.queue.clear()
+
+#endregion
@@ -0,0 +1,209 @@
+#region IMPORTS
+
+import os
+import json
+import asyncio
+import threading
+from typing import Any, Callable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # not on windows: the lock only covers the threads of this process
+
+#endregion
+
+#region GLOBALS
+
+WRITE_DELAY = 2.0 # seconds of quiet to wait for before writing, bursts of changes become one write
+
+#endregion
+
+#region LOCKS
+
+class FileLock:
+
+    # exclusive lock held on a file next to the state it guards, shared by every process of a
+    # cluster. blocking, take it on a worker thread when the event loop can't wait
+
+    def __init__(self, f: str) -> None:
+
+        self.f = f
+        self.lock = threading.Lock() # flock doesn't exclude the threads of the same process
+        self.fd = None
+
+    def __enter__(self):
+
+        self.lock.acquire()
+        try:
+            self.fd = os.open(self.f, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except Exception:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            self.lock.release()
+            raise
+
+        return self
+
+    def __exit__(self, *exc):
+
+        # closing the descriptor releases the flock too
+        os.close(self.fd)
+        self.fd = None
+        self.lock.release()
+
+    async def __aenter__(self):
+
+        # the event loop keeps running while another process holds the lock
+        return await asyncio.to_thread(self.__enter__)
+
+    async def __aexit__(self, *exc):
+
+        self.__exit__(*exc)
+
+#endregion
+
+#region WRITER
+
+def atomic_write(f: str, data: str):
+
+    # a crash can leave a stale .tmp file behind, but never a truncated state file
+    tmp = f"{f}.tmp"
+    with open(tmp, "w") as fp:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    os.replace(tmp, f)
+
+
+class JsonWriter:
+
+    # write-behind persistence for a json state file: dump() calls become schedule(), the
+    # state is snapshotted on the event loop and serialized + written on a worker thread.
+    # a file written by several processes gets a merge: under a FileLock, merge(on_disk,
+    # snapshot) decides what is written, so the changes of the other processes survive
+
+    def __init__(
+        self,
+        f: str,
+        snapshot: Callable[[], Any],
+        delay: float=WRITE_DELAY,
+        indent: int | None=4,
+        default: Callable[[Any], Any] | None=None,
+        merge: Callable[[Any, Any], Any] | None=None,
+        encode: Callable[[Any], str] | None=None
+    ) -> None:
+
+        self.f = f
+        self.snapshot = snapshot
+        self.delay = delay
+        self.indent = indent
+        self.default = default # json encoder for objects in the snapshot, runs on the worker thread
+        self.merge = merge
+        self.encode = encode # text of a snapshot that isn't made of json objects, instead of json.dumps
+        self.shared = FileLock(f"{f}.lock") if merge is not None else None
+
+        self.dirty = False
+        self.closed = False
+        self.task = None
+        self.flushing = asyncio.Event()
+        self.generation = 0 # snapshots taken
+        self.written = 0 # last snapshot that reached the disk
+        self.lock = threading.Lock()
+
+    def schedule(self):
+
+        self.dirty = True
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (startup, shutdown, scripts): write right away
+            self.write(*self.take())
+
+            return
+
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self.run())
+
+    async def run(self):
+
+        while self.dirty:
+            try:
+                await asyncio.wait_for(self.flushing.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+
+            await asyncio.to_thread(self.write, *self.take())
+
+    def take(self):
+
+        self.dirty = False
+        self.generation += 1
+
+        return self.generation, self.snapshot()
+
+    def write(self, generation: int, data: Any):
+
+        text = self.dumps(data) if self.merge is None else None
+
+        with self.lock:
+            # an older snapshot finishing late must not overwrite a newer one
+            if self.closed or generation<=self.written:
+                return
+
+            self.commit(generation, data, text)
+
+    def commit(self, generation: int, data: Any, text: str | None=None):
+
+        if self.shared is None:
+            atomic_write(self.f, text if text is not None else self.dumps(data))
+        else:
+            with self.shared:
+                atomic_write(self.f, self.dumps(self.merge(self.load(), data)))
+
+        self.written = generation
+
+    def dumps(self, data: Any):
+
+        if self.encode is not None:
+            return self.encode(data)
+
+        return json.dumps(data, indent=self.indent, default=self.default)
+
+    def load(self):
+
+        # what is on disk right now, None if there is nothing readable. files are replaced
+        # whole, reading needs no lock
+        try:
+            with open(self.f, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+
+    async def flush(self):
+
+        if self.task is not None and not self.task.done():
+            self.flushing.set()
+            await self.task
+            self.flushing.clear()
+        elif self.dirty:
+            await asyncio.to_thread(self.write, *self.take())
+
+    def close(self):
+
+        # synchronous flush, after this the writer never touches the file again
+        if self.task is not None:
+            self.task.cancel()
+
+        with self.lock:
+            if not self.closed and (self.dirty or self.generation>self.written):
+                self.commit(*self.take())
+
+            self.closed = True
+
+#endregion
@@ -0,0 +1,1415 @@
+#region IMPORTS
+
+from datetime import datetime, timedelta
+import os
+import sys
+import gzip
+import json
+import base64
+import time
+import asyncio
+import sqlite3
+import heapq
+import logging
+import threading
+import discord
+from enum import IntEnum
+from dataclasses import dataclass, replace
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from itertools import count, islice
+from persistence import JsonWriter, atomic_write
+
+#endregion
+
+#region GLOBALS
+
+POLL_STATUS = ["*APERTA*", "*CHIUSA*", "*ELIMINATA*"]
+JOURNAL_COMPACT_SIZE = 1024**2 # compact the journal once it grows past 1MB
+ARCHIVE_SEGMENT_SIZE = 500 # polls per compressed archive segment
+ARCHIVE_CACHE = 4 # archive segments kept in memory once loaded
+
+logger = logging.getLogger("discord")
+
+#endregion
+
+#region HISTORY
+
+class PollStatus(IntEnum):
+
+    OPEN = 0
+    CLOSED = 1
+    DELETED = 2
+
+    @property
+    def label(self):
+
+        return POLL_STATUS[self]
+
+
+@dataclass(slots=True)
+class PollHistoryEntry:
+
+    # a poll as the histories hand it out, a slotted record of ints (epoch seconds, snowflakes,
+    # status enum). the json/sqlite files keep the iso timestamp and status label for
+    # compatibility, PollTable keeps the hot polls as columns of the same ints
+    timestamp: int
+    duration: int
+    quorum: int
+    majority: int
+    channel: int | discord.TextChannel
+    message: int | discord.Message
+    thread: int | discord.Thread
+    status: PollStatus
+    guild: int | discord.Guild | None = None
+    results: dict | None = None
+
+    @property
+    def expires(self):
+
+        return self.timestamp+self.duration
+
+    @property
+    def frozen(self):
+
+        # closed polls carry the final tally taken at closure, older records only the counts
+        return self.results is not None and "question" in self.results
+
+    @staticmethod
+    def epoch(timestamp: str | float):
+
+        # iso timestamps in the files, epoch seconds in memory
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp).timestamp()
+
+        return int(timestamp)
+
+    @staticmethod
+    def status_of(status: str | int):
+
+        return STATUS_BY_LABEL[status] if isinstance(status, str) else PollStatus(status)
+
+    @classmethod
+    def from_dict(cls, entry: dict):
+
+        return cls(
+            timestamp=cls.epoch(entry["timestamp"]),
+            duration=int(entry["duration"]),
+            quorum=int(entry["quorum"]),
+            majority=int(entry["majority"]),
+            channel=entry["channel"],
+            message=entry["message"],
+            thread=entry["thread"],
+            status=cls.status_of(entry["status"]),
+            guild=entry.get("guild"),
+            results=entry.get("results")
+        )
+
+    def to_dict(self):
+
+        entry = {
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
+            "duration": self.duration,
+            "quorum": self.quorum,
+            "majority": self.majority,
+            "channel": self.channel,
+            "message": self.message,
+            "thread": self.thread,
+            "status": self.status.label,
+            "guild": self.guild
+        }
+        if self.results is not None:
+            entry["results"] = self.results
+
+        return entry
+
+
+STATUS_BY_LABEL = {status.label: status for status in PollStatus}
+
+
+class PollTable:
+
+    # the hot polls of a history as parallel arrays in id order, one slot per poll: a poll
+    # costs its raw ints instead of a record of boxed ints plus two dict entries. records
+    # are built when a poll is read and written back whole, thread and message lookups
+    # bisect sorted copies of their columns
+
+    COLUMNS = (
+        "ids", "timestamp", "duration", "quorum", "majority", "channel", "message", "thread",
+        "status", "guild", "results"
+    )
+    INDEXED = ("thread", "message")
+
+    def __init__(self) -> None:
+
+        self.ids = array("q")
+        self.timestamp = array("q")
+        self.duration = array("i")
+        self.quorum = array("h")
+        self.majority = array("h")
+        self.channel = array("Q")
+        self.message = array("Q")
+        self.thread = array("Q")
+        self.status = array("b")
+        self.guild = array("Q") # 0: unknown
+        self.results = [] # the snapshot dicts, None until the poll is closed
+
+        self.indexes = {key: (array("Q"), array("q")) for key in self.INDEXED} # sorted values, ids
+
+    @classmethod
+    def load(cls, f):
+
+        # a plain json.load, then one column at a time: the dicts of the polls are dropped
+        # once the columns are built and no record is made for any of them
+        polls = json.load(f)
+        keys = array("q", map(int, polls))
+        entries = list(polls.values())
+        del polls
+
+        # the file is written in id order, older ones were almost
+        if list(keys)!=sorted(keys):
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            keys = array("q", [keys[i] for i in order])
+            entries = [entries[i] for i in order]
+
+        table = cls()
+        table.ids = keys
+
+        timestamps = [entry["timestamp"] for entry in entries]
+        try:
+            # iso strings, converted without a python call per poll
+            table.timestamp = array(
+                "q", map(int, map(datetime.timestamp, map(datetime.fromisoformat, timestamps)))
+            )
+        except TypeError:
+            table.timestamp = array("q", map(PollHistoryEntry.epoch, timestamps))
+        del timestamps
+
+        table.duration = array("i", map(int, [entry["duration"] for entry in entries]))
+        table.quorum = array("h", map(int, [entry["quorum"] for entry in entries]))
+        table.majority = array("h", map(int, [entry["majority"] for entry in entries]))
+        table.channel = array("Q", [entry["channel"] for entry in entries])
+        table.message = array("Q", [entry["message"] for entry in entries])
+        table.thread = array("Q", [entry["thread"] for entry in entries])
+        table.status = array("b", [STATUS_BY_LABEL.get(entry["status"], entry["status"]) for entry in entries])
+        table.guild = array("Q", [entry.get("guild") or 0 for entry in entries])
+        table.results = [entry.get("results") for entry in entries]
+        del entries
+
+        table.index()
+
+        return table
+
+    def dumps(self):
+
+        # the history file, a poll per line: serialized one at a time, so the records of the
+        # whole history never exist together
+        lines = (f"    {json.dumps(id)}: {json.dumps(entry.to_dict())}" for id, entry in self.items())
+
+        return "{\n"+",\n".join(lines)+"\n}"
+
+    def index(self):
+
+        # polls are created in snowflake order: the columns are usually sorted already
+        for key in self.INDEXED:
+            column = getattr(self, key)
+            if list(column)==sorted(column):
+                self.indexes[key] = (column[:], self.ids[:])
+                continue
+
+            order = sorted(range(len(column)), key=column.__getitem__)
+            self.indexes[key] = (array("Q", [column[i] for i in order]), array("q", [self.ids[i] for i in order]))
+
+    def index_add(self, key: str, value: int, id: int):
+
+        values, ids = self.indexes[key]
+        i = bisect_right(values, value)
+        values.insert(i, value)
+        ids.insert(i, id)
+
+    def index_remove(self, key: str, value: int, id: int):
+
+        values, ids = self.indexes[key]
+        i = bisect_left(values, value)
+        while ids[i]!=id:
+            i += 1
+
+        del values[i]
+        del ids[i]
+
+    @property
+    def columns(self):
+
+        return [getattr(self, name) for name in self.COLUMNS]
+
+    def snapshot(self):
+
+        # the columns copy as a memcpy each, what the writer thread serializes while the
+        # loop keeps changing the table. a snapshot has no lookup indexes
+        table = PollTable()
+        for name in self.COLUMNS:
+            setattr(table, name, getattr(self, name)[:])
+
+        return table
+
+    def slot(self, id: str | int):
+
+        key = int(id)
+        i = bisect_left(self.ids, key)
+
+        return i if i<len(self.ids) and self.ids[i]==key else None
+
+    def entry(self, i: int):
+
+        return PollHistoryEntry(
+            timestamp=self.timestamp[i],
+            duration=self.duration[i],
+            quorum=self.quorum[i],
+            majority=self.majority[i],
+            channel=self.channel[i],
+            message=self.message[i],
+            thread=self.thread[i],
+            status=PollStatus(self.status[i]),
+            guild=self.guild[i] or None,
+            results=self.results[i]
+        )
+
+    def get(self, id: str, default=None):
+
+        i = self.slot(id)
+
+        return self.entry(i) if i is not None else default
+
+    def find(self, key: str, value: int):
+
+        values, ids = self.indexes[key]
+        i = bisect_left(values, value)
+
+        return ids[i] if i<len(values) and values[i]==value else None
+
+    def items(self):
+
+        return ((str(self.ids[i]), self.entry(i)) for i in range(len(self.ids)))
+
+    def __getitem__(self, id: str):
+
+        i = self.slot(id)
+        if i is None:
+            raise KeyError(id)
+
+        return self.entry(i)
+
+    def __setitem__(self, id: str, entry: PollHistoryEntry):
+
+        key = int(id)
+        row = (
+            key, entry.timestamp, entry.duration, entry.quorum, entry.majority, entry.channel,
+            entry.message, entry.thread, entry.status, entry.guild or 0, entry.results
+        )
+
+        i = bisect_left(self.ids, key)
+        if i<len(self.ids) and self.ids[i]==key:
+            for name in self.INDEXED:
+                old = getattr(self, name)[i]
+                if old!=getattr(entry, name):
+                    self.index_remove(name, old, key)
+                    self.index_add(name, getattr(entry, name), key)
+
+            for column, value in zip(self.columns, row):
+                column[i] = value
+
+            return
+
+        # new polls get the highest id, the insertion is an append
+        for column, value in zip(self.columns, row):
+            column.insert(i, value)
+        for name in self.INDEXED:
+            self.index_add(name, getattr(entry, name), key)
+
+    def remove(self, keys: list):
+
+        # polls missing from the table are skipped. archived polls leave as a prefix of
+        # the table: the slots are deleted a contiguous run at a time
+        slots = sorted(i for i in map(self.slot, keys) if i is not None)
+        if not slots:
+            return
+
+        runs = []
+        for i in slots:
+            if runs and runs[-1][1]==i:
+                runs[-1][1] = i+1
+            else:
+                runs.append([i, i+1])
+
+        drop = {self.ids[i] for i in slots}
+        for start, stop in reversed(runs):
+            for column in self.columns:
+                del column[start:stop]
+
+        for key, (values, ids) in self.indexes.items():
+            keep = [j for j, id in enumerate(ids) if id not in drop]
+            self.indexes[key] = (array("Q", [values[j] for j in keep]), array("q", [ids[j] for j in keep]))
+
+    def __contains__(self, id: str):
+
+        return self.slot(id) is not None
+
+    def __iter__(self):
+
+        return (str(id) for id in self.ids)
+
+    def __len__(self):
+
+        return len(self.ids)
+
+
+class PollArchive:
+
+    # cold tier of the history: old closed/deleted polls in immutable gzipped jsonl segments,
+    # each covering a contiguous id range. only the manifest is read at startup, segments are
+    # loaded on demand and a few are kept in an lru cache
+
+    def __init__(self, path: str, cache_size: int=ARCHIVE_CACHE) -> None:
+
+        self.path = path
+        self.fmanifest = f"{path}/manifest.json"
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        self.segments = []
+        if os.path.exists(self.fmanifest):
+            with open(self.fmanifest, "r") as f:
+                self.segments = json.load(f)
+
+        self.firsts = [segment["first"] for segment in self.segments]
+        self.lasts = [segment["last"] for segment in self.segments]
+
+    @property
+    def last(self):
+
+        return self.lasts[-1] if self.lasts else 0
+
+    def __len__(self):
+
+        return sum(segment["count"] for segment in self.segments)
+
+    def load(self, n: int):
+
+        segment = self.segments[n]
+        if segment["file"] in self.cache:
+            self.cache.move_to_end(segment["file"])
+
+            return self.cache[segment["file"]]
+
+        ids, entries = [], []
+        with gzip.open(os.path.join(self.path, segment["file"]), "rt") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                entries.append(PollHistoryEntry.from_dict(record["entry"]))
+
+        self.cache[segment["file"]] = (ids, entries)
+        if len(self.cache)>self.cache_size:
+            self.cache.popitem(last=False)
+
+        return ids, entries
+
+    def get(self, id: int):
+
+        n = bisect_left(self.lasts, id)
+        if n==len(self.segments) or self.firsts[n]>id:
+            return None
+
+        ids, entries = self.load(n)
+        i = bisect_left(ids, id)
+        if i<len(ids) and ids[i]==id:
+            return entries[i]
+
+    def find_by(self, key: str, value: int):
+
+        # thread and message snowflakes grow with the poll ids, so the per-segment
+        # ranges in the manifest narrow the search down to (usually) one segment
+        for n, segment in enumerate(self.segments):
+            if segment[key][0]<=value<=segment[key][1]:
+                ids, entries = self.load(n)
+                for id, entry in zip(ids, entries):
+                    if getattr(entry, key)==value:
+                        return id
+
+    def ascending(self, id: int, strict: bool):
+
+        for n in range(bisect_left(self.lasts, id), len(self.segments)):
+            ids, entries = self.load(n)
+            start = bisect_right(ids, id) if strict else bisect_left(ids, id)
+            for i in range(start, len(ids)):
+                yield ids[i], entries[i]
+
+    def descending(self, id: int, strict: bool):
+
+        n = bisect_left(self.firsts, id) if strict else bisect_right(self.firsts, id)
+        for n in range(n-1, -1, -1):
+            ids, entries = self.load(n)
+            stop = bisect_left(ids, id) if strict else bisect_right(ids, id)
+            for i in range(stop-1, -1, -1):
+                yield ids[i], entries[i]
+
+    def write_segment(self, entries: list):
+
+        # runs on a worker thread: compress and write one segment, return its manifest record
+        first, last = entries[0][0], entries[-1][0]
+        segment = {
+            "file": f"segment_{first}_{last}.jsonl.gz",
+            "first": first,
+            "last": last,
+            "count": len(entries),
+            "thread": [min(entry.thread for _, entry in entries), max(entry.thread for _, entry in entries)],
+            "message": [min(entry.message for _, entry in entries), max(entry.message for _, entry in entries)]
+        }
+
+        f = os.path.join(self.path, segment["file"])
+        with gzip.open(f"{f}.tmp", "wt") as fp:
+            for id, entry in entries:
+                fp.write(json.dumps({"id": id, "entry": entry.to_dict()})+"\n")
+        os.replace(f"{f}.tmp", f)
+
+        return segment
+
+    def add_segment(self, segment: dict):
+
+        self.segments.append(segment)
+        self.firsts.append(segment["first"])
+        self.lasts.append(segment["last"])
+        atomic_write(self.fmanifest, json.dumps(self.segments))
+
+
+class PollHistory:
+
+    batched = None # ids changed inside batch(), committed when the outermost one exits
+    depth = 0 # batches open, bulk actions on the same guild can overlap
+    versions = count(1) # shared by every history: a reloaded partition never repeats a version
+
+    def __init__(self, f: str, archive: PollArchive | None=None) -> None:
+
+        self.f = f
+        self.archive = archive
+        self.version = next(PollHistory.versions) # new on every change, renders compare against it
+        self.database = self.load()
+        self.prune_archived()
+        self.index()
+
+        # the writer thread serializes a copy of the columns, the loop keeps changing these
+        self.writer = JsonWriter(
+            self.f,
+            lambda: self.database.snapshot(),
+            encode=PollTable.dumps
+        )
+
+    def load(self):
+
+        if not os.path.exists(self.f):
+            with open(self.f, "w") as _:
+                return PollTable()
+        else:
+            with open(self.f, "r") as f:
+                try:
+                    return PollTable.load(f)
+                except json.decoder.JSONDecodeError:
+                    return PollTable()
+
+    @property
+    def order(self):
+
+        # sorted poll ids, pages are located by bisection instead of walking the history
+        return self.database.ids
+
+
+    def dump(self):
+
+        self.writer.schedule()
+
+    def register(
+        self,
+        time: datetime,
+        duration: timedelta,
+        quorum: int,
+        majority: int,
+        channel: discord.TextChannel,
+        message: discord.Message,
+        thread: discord.Thread,
+        status: PollStatus
+    ):
+
+        entry = PollHistoryEntry(
+            timestamp=int(time.timestamp()),
+            duration=int(duration.total_seconds()),
+            quorum=quorum,
+            majority=majority,
+            channel=channel.id,
+            message=message.id,
+            thread=thread.id,
+            status=PollStatus(status),
+            guild=channel.guild.id
+        )
+
+        return self.add(entry)
+
+    def add(self, entry: PollHistoryEntry):
+
+        last = self.order[-1] if self.order else 0
+        if self.archive is not None:
+            last = max(last, self.archive.last)
+
+        id = str(last+1)
+        self.database[id] = entry
+        heapq.heappush(self.expiries, (entry.expires, id))
+        self.commit(id)
+
+        return id
+
+    def restore(self, entries: list):
+
+        # bulk import of (id, entry) pairs keeping their ids, used to split a legacy history
+        for id, entry in entries:
+            self.database[id] = entry
+
+        self.index()
+        self.commit(*[id for id, _ in entries])
+
+    def index(self):
+
+        # min-heap of (expiry epoch, id) of the open polls, closed polls never get looked at
+        # again. the open ones are found by searching the raw status column, a byte per poll
+        table = self.database
+        status = table.status.tobytes()
+        self.expiries = []
+        i = status.find(PollStatus.OPEN)
+        while i!=-1:
+            self.expiries.append((table.timestamp[i]+table.duration[i], str(table.ids[i])))
+            i = status.find(PollStatus.OPEN, i+1)
+        heapq.heapify(self.expiries)
+
+    def retrieve(self, id):
+
+        # a copy, callers swap the ids for the discord objects
+        return replace(self.get(id))
+
+    def get(self, id: str):
+
+        entry = self.database.get(id)
+        if entry is None and self.archive is not None:
+            entry = self.archive.get(int(id))
+
+        return entry
+
+    def ascending(self, id: int, strict: bool):
+
+        # (id, entry) pairs in id order from id on, merging the archive (lazily loaded)
+        # with the hot polls, which shadow archived polls brought back by thaw()
+        start = bisect_right(self.order, id) if strict else bisect_left(self.order, id)
+        hot = ((self.order[i], self.database.entry(i)) for i in range(start, len(self.order)))
+        if self.archive is None:
+            return hot
+
+        cold = (
+            (key, entry) for key, entry in self.archive.ascending(id, strict) 
+            if str(key) not in self.database
+        )
+
+        return heapq.merge(cold, hot, key=lambda item: item[0])
+
+    def descending(self, id: int, strict: bool):
+
+        stop = bisect_left(self.order, id) if strict else bisect_right(self.order, id)
+        hot = ((self.order[i], self.database.entry(i)) for i in range(stop-1, -1, -1))
+        if self.archive is None:
+            return hot
+
+        cold = (
+            (key, entry) for key, entry in self.archive.descending(id, strict) 
+            if str(key) not in self.database
+        )
+
+        return heapq.merge(cold, hot, key=lambda item: item[0], reverse=True)
+
+    def take(self, items, limit: int):
+
+        return [(str(key), entry) for key, entry in islice(items, limit)]
+
+    def page_at(self, id: str | None=None, limit: int=10):
+
+        return self.take(self.ascending(0 if id is None else int(id), strict=False), limit)
+
+    def page_after(self, id: str, limit: int=10):
+
+        return self.take(self.ascending(int(id), strict=True), limit)
+
+    def page_before(self, id: str, limit: int=10):
+
+        return self.take(self.descending(int(id), strict=True), limit)[::-1]
+
+    def page_last(self, limit: int=10):
+
+        return self.take(self.descending(sys.maxsize, strict=False), limit)[::-1]
+
+    def has_before(self, id: str):
+
+        return len(self.take(self.descending(int(id), strict=True), 1))>0
+
+    def has_after(self, id: str):
+
+        return len(self.take(self.ascending(int(id), strict=True), 1))>0
+
+    def find_by_thread(self, thread: int):
+
+        id = self.database.find("thread", thread)
+        if id is None and self.archive is not None:
+            id = self.archive.find_by("thread", thread)
+
+        return str(id) if id is not None else None
+
+    def find_by_message(self, message: int):
+
+        id = self.database.find("message", message)
+        if id is None and self.archive is not None:
+            id = self.archive.find_by("message", message)
+
+        return str(id) if id is not None else None
+
+    def __len__(self):
+
+        if self.archive is None:
+            return len(self.database)
+
+        thawed = bisect_right(self.order, self.archive.last)
+
+        return len(self.database)+len(self.archive)-thawed
+
+    def prune_archived(self):
+
+        # polls that reached the archive but whose eviction was never persisted (crash in
+        # between) are dropped here, thawed polls differ from their archived copy and stay
+        if self.archive is None:
+            return
+
+        self.database.remove([
+            id for id in self.database
+            if int(id)<=self.archive.last and self.database[id]==self.archive.get(int(id))
+        ])
+
+    def thaw(self, id: str):
+
+        # archived polls are immutable, changing one brings it back to the hot tier
+        entry = replace(self.archive.get(int(id)))
+        self.database[id] = entry
+
+        return entry
+
+    def hot(self, id: str):
+
+        return self.database[id] if id in self.database else self.thaw(id)
+
+    async def archive_closed(self, age: float):
+
+        if self.archive is None:
+            return 0
+
+        # open polls last at most a week, so the polls old enough to archive are a
+        # contiguous prefix of the history: take it up to the first one that isn't
+        now = datetime.now().timestamp()
+        candidates = []
+        for i in range(bisect_right(self.order, self.archive.last), len(self.order)):
+            entry = self.database.entry(i)
+            if entry.status==PollStatus.OPEN or entry.expires+age>now:
+                break
+
+            candidates.append((self.order[i], entry))
+
+        n = len(candidates)//ARCHIVE_SEGMENT_SIZE*ARCHIVE_SEGMENT_SIZE
+        for start in range(0, n, ARCHIVE_SEGMENT_SIZE):
+            segment = await asyncio.to_thread(
+                self.archive.write_segment, 
+                candidates[start:start+ARCHIVE_SEGMENT_SIZE]
+            )
+            self.archive.add_segment(segment)
+
+        # a poll changed while its segment was being written stays hot, shadowing the archived copy
+        self.evict([
+            str(id) for id, entry in candidates[:n] if self.database.get(str(id))==entry
+        ])
+
+        return n
+
+    def evict(self, ids: list):
+
+        if not ids:
+            return
+
+        self.database.remove(ids)
+
+        self.commit(*ids)
+
+    def update(self, id: str | None=None, status: int | None=None):
+
+        if id is not None and status is not None:
+            self.database[id] = replace(self.hot(id), status=PollStatus(status))
+            self.commit(id)
+
+            return []
+
+        # expiry sweep, returns the polls it closed so the caller can announce them
+        expired = []
+        now = datetime.now().timestamp()
+        while self.expiries and self.expiries[0][0]<=now:
+            _, key = heapq.heappop(self.expiries)
+            entry = self.database[key]
+
+            # polls closed or deleted by hand leave a stale item behind
+            if entry.status==PollStatus.OPEN:
+                self.database[key] = replace(entry, status=PollStatus.CLOSED)
+                expired.append(key)
+
+        if expired:
+            self.commit(*expired)
+
+        return expired
+
+    def open_polls(self):
+
+        return sorted(
+            {id for _, id in self.expiries if self.database[id].status==PollStatus.OPEN}, key=int
+        )
+
+    def next_expiry(self):
+
+        while self.expiries and self.database[self.expiries[0][1]].status!=PollStatus.OPEN:
+            heapq.heappop(self.expiries)
+
+        if self.expiries:
+            return self.expiries[0][0]
+
+    def set_results(self, id: str, results: dict):
+
+        self.database[id] = replace(self.hot(id), results=results)
+        self.commit(id)
+
+    @contextmanager
+    def batch(self):
+
+        # bulk changes: one write at the end instead of one per poll
+        if not self.depth:
+            self.batched = []
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                ids, self.batched = self.batched, None
+                if ids:
+                    self.commit(*dict.fromkeys(ids))
+
+    def commit(self, *ids: str):
+
+        # changes inside a batch are already visible in memory
+        self.version = next(PollHistory.versions)
+        if self.batched is not None:
+            self.batched.extend(ids)
+
+            return
+
+        self.persist(*ids)
+
+    def persist(self, *ids: str):
+
+        self.dump()
+
+    async def flush(self):
+
+        await self.writer.flush()
+
+    def close(self):
+
+        self.writer.close()
+
+
+class PollHistoryJournal(PollHistory):
+
+    # every mutation appends the full entry as one json line to the journal, state is
+    # rebuilt at load time by replaying the journal on top of the last snapshot (the
+    # json file used by PollHistory, so existing histories are imported as they are)
+
+    def __init__(
+        self,
+        f: str,
+        compact_size: int=JOURNAL_COMPACT_SIZE,
+        archive: PollArchive | None=None
+    ) -> None:
+
+        self.journal = f"{os.path.splitext(f)[0]}.journal"
+        self.sealed = f"{self.journal}.1" # journal being merged into the snapshot
+        self.compact_size = compact_size
+        self.compactor = None
+
+        super().__init__(f, archive=archive)
+
+        self.journal_size = os.path.getsize(self.journal) if os.path.exists(self.journal) else 0
+        if os.path.exists(self.sealed):
+            self.compact() # resume a compaction interrupted by a restart
+
+    def load(self):
+
+        database = super().load()
+        self.replay(self.sealed, database)
+        self.replay(self.journal, database)
+
+        return database
+
+    def replay(self, journal: str, database: PollTable):
+
+        if not os.path.exists(journal):
+            return
+
+        # every record is the whole poll, the last one of each id is its state
+        changes = {}
+        with open(journal, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    break # torn write at the end of the journal
+
+                changes[record["id"]] = record["entry"]
+
+        # polls moved to the archive leave together, the way they were evicted
+        database.remove([id for id, entry in changes.items() if entry is None])
+        for id, entry in changes.items():
+            if entry is not None:
+                database[id] = PollHistoryEntry.from_dict(entry)
+
+    def persist(self, *ids: str):
+
+        records = "".join(
+            json.dumps({
+                "id": id, 
+                "entry": self.database[id].to_dict() if id in self.database else None
+            })+"\n" for id in ids
+        )
+        with open(self.journal, "a") as f:
+            f.write(records)
+
+        self.journal_size += len(records)
+        if self.journal_size>=self.compact_size:
+            self.compact()
+
+    def compact(self):
+
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+
+        # seal the current journal and keep appending to a fresh one while the sealed
+        # records are merged into the snapshot on a background thread
+        if not os.path.exists(self.sealed):
+            if not os.path.exists(self.journal):
+                return
+
+            os.replace(self.journal, self.sealed)
+            self.journal_size = 0
+
+        self.compactor = threading.Thread(target=self.merge, daemon=True)
+        self.compactor.start()
+
+    def merge(self):
+
+        try:
+            database = PollHistory.load(self)
+            self.replay(self.sealed, database)
+
+            atomic_write(self.f, database.dumps())
+            os.remove(self.sealed)
+        except Exception as e:
+            logger.exception(e)
+
+    def dump(self):
+
+        self.compact()
+
+    def close(self):
+
+        super().close()
+        if self.compactor is not None:
+            self.compactor.join()
+
+
+def open_database(f: str):
+
+    connection = sqlite3.connect(f)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+
+    return connection
+
+
+class PollHistorySqlite(PollHistory):
+
+    # same interface as PollHistory, but entries live in an indexed sqlite table so lookups
+    # and status transitions are queries instead of walks over the whole history
+
+    KEYS = ["timestamp", "duration", "quorum", "majority", "channel", "message", "thread", "status", "guild"]
+
+    def __init__(
+        self,
+        f: str,
+        connection: sqlite3.Connection,
+        archive: PollArchive | None=None
+    ) -> None:
+
+        self.f = f # legacy json history, imported on first use
+        self.connection = connection
+        self.version = next(PollHistory.versions)
+
+        with self.connection:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS polls (
+                    id INTEGER PRIMARY KEY,
+                    timestamp TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    quorum INTEGER NOT NULL,
+                    majority INTEGER NOT NULL,
+                    channel INTEGER NOT NULL,
+                    message INTEGER NOT NULL,
+                    thread INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    guild INTEGER,
+                    results TEXT
+                );
+                CREATE INDEX IF NOT EXISTS polls_thread ON polls(thread);
+                CREATE INDEX IF NOT EXISTS polls_message ON polls(message);
+                CREATE INDEX IF NOT EXISTS polls_status_expires ON polls(status, expires);
+                CREATE INDEX IF NOT EXISTS polls_guild ON polls(guild);
+                """
+            )
+
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(polls)")]
+            if "results" not in columns:
+                self.connection.execute("ALTER TABLE polls ADD COLUMN results TEXT")
+
+        self.load(archive)
+
+    def load(self, archive: PollArchive | None=None):
+
+        # the journal only keeps tombstones of the archived polls, they come from the
+        # archive segments; the pages merge the two tiers in id order
+        if len(self) or not os.path.exists(self.f):
+            return
+
+        legacy = PollHistoryJournal(self.f, archive=archive)
+        legacy.close()
+
+        with self.connection:
+            entries = legacy.page_at(limit=1000)
+            while entries:
+                for id, entry in entries:
+                    self.insert(int(id), entry)
+
+                entries = legacy.page_after(entries[-1][0], limit=1000)
+
+    def insert(self, id: int | None, entry: PollHistoryEntry):
+
+        # the results snapshot of a closed poll can't be fetched again, it must come along
+        payload = entry.to_dict()
+        results = json.dumps(entry.results) if entry.results is not None else None
+        cursor = self.connection.execute(
+            "INSERT INTO polls (id, expires, results, "+", ".join(self.KEYS)+") "
+            "VALUES (?, ?, ?, "+", ".join("?" for _ in self.KEYS)+")",
+            [id, entry.expires, results]+[payload[key] for key in self.KEYS]
+        )
+
+        return str(cursor.lastrowid)
+
+    def to_entry(self, row: sqlite3.Row):
+
+        entry = {key: row[key] for key in self.KEYS}
+        if row["results"] is not None:
+            entry["results"] = json.loads(row["results"])
+
+        return PollHistoryEntry.from_dict(entry)
+
+    def dump(self):
+
+        self.connection.commit()
+
+    async def flush(self):
+
+        self.connection.commit()
+
+    def close(self):
+
+        self.connection.commit()
+
+    def transaction(self):
+
+        self.version = next(PollHistory.versions)
+
+        return self.connection if self.batched is None else nullcontext()
+
+    @contextmanager
+    def batch(self):
+
+        # a single transaction, committed when the outermost batch exits
+        if not self.depth:
+            self.batched = []
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.batched = None
+                self.connection.commit()
+
+    def add(self, entry: PollHistoryEntry):
+
+        with self.transaction():
+            return self.insert(None, entry)
+
+    def restore(self, entries: list):
+
+        self.version = next(PollHistory.versions)
+        with self.connection:
+            for id, entry in entries:
+                self.insert(int(id), entry)
+
+    async def archive_closed(self, age: float):
+
+        # every poll already lives on disk behind the indexes, there is no hot tier to shrink
+        return 0
+
+    def update(self, id: str | None=None, status: int | None=None):
+
+        if id is not None and status is not None:
+            with self.transaction():
+                self.connection.execute(
+                    "UPDATE polls SET status=? WHERE id=?",
+                    (POLL_STATUS[status], int(id))
+                )
+
+            return []
+
+        with self.transaction():
+            expired = [
+                row["id"] for row in self.connection.execute(
+                    "SELECT id FROM polls WHERE status=? AND expires<=?",
+                    (POLL_STATUS[0], datetime.now().timestamp())
+                )
+            ]
+            self.connection.executemany(
+                "UPDATE polls SET status=? WHERE id=?",
+                [(POLL_STATUS[1], key) for key in expired]
+            )
+
+        return [str(key) for key in expired]
+
+    def open_polls(self):
+
+        return [
+            str(row["id"]) for row in self.connection.execute(
+                "SELECT id FROM polls WHERE status=? ORDER BY id", (POLL_STATUS[0],)
+            )
+        ]
+
+    def next_expiry(self):
+
+        return self.connection.execute(
+            "SELECT MIN(expires) FROM polls WHERE status=?", (POLL_STATUS[0],)
+        ).fetchone()[0]
+
+    def set_results(self, id: str, results: dict):
+
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE polls SET results=? WHERE id=?", (json.dumps(results), int(id))
+            )
+
+    def get(self, id: str):
+
+        row = self.connection.execute("SELECT * FROM polls WHERE id=?", (int(id),)).fetchone()
+
+        return self.to_entry(row) if row is not None else None
+
+    def to_page(self, rows: list):
+
+        return [(str(row["id"]), self.to_entry(row)) for row in rows]
+
+    def page_at(self, id: str | None=None, limit: int=10):
+
+        rows = self.connection.execute(
+            "SELECT * FROM polls WHERE id>=? ORDER BY id LIMIT ?",
+            (0 if id is None else int(id), limit)
+        )
+
+        return self.to_page(rows)
+
+    def page_after(self, id: str, limit: int=10):
+
+        rows = self.connection.execute(
+            "SELECT * FROM polls WHERE id>? ORDER BY id LIMIT ?", (int(id), limit)
+        )
+
+        return self.to_page(rows)
+
+    def page_before(self, id: str, limit: int=10):
+
+        rows = self.connection.execute(
+            "SELECT * FROM polls WHERE id<? ORDER BY id DESC LIMIT ?", (int(id), limit)
+        )
+
+        return self.to_page(reversed(rows.fetchall()))
+
+    def page_last(self, limit: int=10):
+
+        rows = self.connection.execute("SELECT * FROM polls ORDER BY id DESC LIMIT ?", (limit,))
+
+        return self.to_page(reversed(rows.fetchall()))
+
+    def has_before(self, id: str):
+
+        return self.connection.execute(
+            "SELECT 1 FROM polls WHERE id<? LIMIT 1", (int(id),)
+        ).fetchone() is not None
+
+    def has_after(self, id: str):
+
+        return self.connection.execute(
+            "SELECT 1 FROM polls WHERE id>? LIMIT 1", (int(id),)
+        ).fetchone() is not None
+
+    def find_by_thread(self, thread: int):
+
+        row = self.connection.execute("SELECT id FROM polls WHERE thread=?", (thread,)).fetchone()
+
+        return str(row["id"]) if row is not None else None
+
+    def find_by_message(self, message: int):
+
+        row = self.connection.execute("SELECT id FROM polls WHERE message=?", (message,)).fetchone()
+
+        return str(row["id"]) if row is not None else None
+
+    def __len__(self):
+
+        return self.connection.execute("SELECT COUNT(*) FROM polls").fetchone()[0]
+
+#endregion
+
+#region VOTERS
+
+class VoterLedger:
+
+    # who voted what, per poll message, kept up to date by the gateway vote events: every
+    # answer holds a sorted array('Q') of user ids, stored as base64 in the json file. a
+    # poll's voters are only trusted if it was synced (paged over the api once) after the
+    # current gateway session started, votes cast while the bot was offline are not replayed.
+    # a sync in progress keeps its checkpoints here too, so it can resume after a restart
+
+    changes = count(1) # shared by every ledger, like PollHistory.versions
+
+    def __init__(self, f: str) -> None:
+
+        self.f = f
+        self.polls = self.load() # message id -> {"synced": epoch | None, "answers": {answer id: array}}
+        self.versions = {} # message id -> version of its votes, in memory only
+        self.version0 = next(VoterLedger.changes) # of the polls without votes since loading
+        self.revision = self.version0 # last sync or discard, closed polls change only then
+
+        self.writer = JsonWriter(
+            self.f,
+            self.snapshot,
+            indent=None,
+            default=lambda data: base64.b64encode(data).decode()
+        )
+
+    def load(self):
+
+        if not os.path.exists(self.f):
+            return {}
+
+        with open(self.f, "r") as f:
+            try:
+                polls = json.load(f)
+            except json.decoder.JSONDecodeError:
+                return {}
+
+        for poll in polls.values():
+            poll["answers"] = self.decode(poll["answers"])
+
+            backfill = poll.get("backfill")
+            if backfill is not None:
+                backfill["after"] = {int(answer): after for answer, after in backfill["after"].items()}
+                backfill["crawled"] = self.decode(backfill["crawled"])
+                backfill["events"] = {
+                    int(answer): {int(user): voted for user, voted in events.items()}
+                    for answer, events in backfill["events"].items()
+                }
+
+        return {int(message): poll for message, poll in polls.items()}
+
+    def decode(self, answers: dict):
+
+        return {int(answer): array("Q", base64.b64decode(voters)) for answer, voters in answers.items()}
+
+    def encode(self, answers: dict):
+
+        # bytes are immutable, the writer thread can encode them while votes keep coming
+        return {answer: voters.tobytes() for answer, voters in answers.items()}
+
+    def snapshot(self):
+
+        polls = {}
+        for message, poll in self.polls.items():
+            polls[message] = {"synced": poll["synced"], "answers": self.encode(poll["answers"])}
+
+            backfill = poll.get("backfill")
+            if backfill is not None:
+                polls[message]["backfill"] = {
+                    "started": backfill["started"],
+                    "updated": backfill["updated"],
+                    "after": dict(backfill["after"]),
+                    "crawled": self.encode(backfill["crawled"]),
+                    "events": {answer: dict(events) for answer, events in backfill["events"].items()}
+                }
+
+        return polls
+
+    def poll(self, message: int):
+
+        return self.polls.setdefault(message, {"synced": None, "answers": {}})
+
+    def add(self, message: int, answer: int, user: int):
+
+        poll = self.poll(message)
+        self.record(poll, answer, user, True)
+        self.versions[message] = next(VoterLedger.changes)
+
+        voters = poll["answers"].setdefault(answer, array("Q"))
+        i = bisect_left(voters, user)
+        if i==len(voters) or voters[i]!=user:
+            voters.insert(i, user)
+            self.writer.schedule()
+
+    def remove(self, message: int, answer: int, user: int):
+
+        poll = self.poll(message)
+        self.record(poll, answer, user, False)
+        self.versions[message] = next(VoterLedger.changes)
+
+        voters = poll["answers"].get(answer)
+        if voters is None:
+            return
+
+        i = bisect_left(voters, user)
+        if i<len(voters) and voters[i]==user:
+            del voters[i]
+            self.writer.schedule()
+
+    def record(self, poll: dict, answer: int, user: int, voted: bool):
+
+        # a vote seen while a sync is paging over the api wins over whatever the api returned
+        if "backfill" in poll:
+            poll["backfill"]["events"].setdefault(answer, {})[user] = voted
+            self.writer.schedule()
+
+    def begin(self, message: int, started: float, resume: float):
+
+        # start a sync, or resume the one left behind if it made progress in the last resume seconds
+        poll = self.poll(message)
+        backfill = poll.get("backfill")
+        if backfill is None or backfill["updated"]<started-resume:
+            poll["backfill"] = {"started": started, "updated": started, "after": {}, "crawled": {}, "events": {}}
+        else:
+            backfill["started"] = started
+
+        self.writer.schedule()
+
+    def checkpoint(self, message: int, answer: int):
+
+        # last voter id already crawled for the answer
+        return self.polls[message]["backfill"]["after"].get(answer)
+
+    def crawled(self, message: int, answer: int, voters: list):
+
+        # the api pages in id order but discord.py yields every page backwards: the checkpoint
+        # is the highest id, finish() sorts the crawled voters anyway
+        backfill = self.polls[message]["backfill"]
+        backfill["crawled"].setdefault(answer, array("Q")).extend(voters)
+        if voters:
+            backfill["after"][answer] = max(voters)
+        backfill["updated"] = time.time()
+
+        self.writer.schedule()
+
+    def finish(self, message: int):
+
+        poll = self.polls[message]
+        backfill = poll.pop("backfill")
+
+        answers = {}
+        for answer in set(backfill["crawled"])|set(backfill["events"]):
+            voters = set(backfill["crawled"].get(answer, ()))
+            for user, voted in backfill["events"].get(answer, {}).items():
+                if voted:
+                    voters.add(user)
+                else:
+                    voters.discard(user)
+
+            answers[answer] = array("Q", sorted(voters))
+
+        poll["answers"] = answers
+        poll["synced"] = backfill["started"]
+        self.versions[message] = self.revision = next(VoterLedger.changes)
+        self.writer.schedule()
+
+    def voters(self, message: int, since: float | None):
+
+        # ids of everyone who voted at least one answer, None if the ledger wasn't synced
+        # since the given time (since=None: whatever the ledger has, trusted or not)
+        poll = self.polls.get(message)
+        if poll is None:
+            return None if since is not None else set()
+
+        if since is not None and (poll["synced"] is None or poll["synced"]<since):
+            return None
+
+        voters = set()
+        for answer in poll["answers"].values():
+            voters.update(answer)
+
+        return voters
+
+    def version(self, message: int):
+
+        return self.versions.get(message, self.version0)
+
+    def discard(self, message: int):
+
+        self.versions.pop(message, None)
+        self.revision = next(VoterLedger.changes)
+        if self.polls.pop(message, None) is not None:
+            self.writer.schedule()
+
+    async def flush(self):
+
+        await self.writer.flush()
+
+    def close(self):
+
+        self.writer.close()
+
+#endregion
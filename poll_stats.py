@@ -0,0 +1,231 @@
+#region IMPORTS
+
+from datetime import datetime
+import asyncio
+import numpy as np
+from poll_history import PollStatus
+
+#endregion
+
+#region GLOBALS
+
+STATS_PAGE = 1_000 # polls read from the history per page, the event loop runs between two pages
+STATS_TOP = 5 # most active members listed
+
+#endregion
+
+#region COLUMNS
+
+class PollColumns:
+
+    # the history of a guild as parallel arrays, one slot per poll. the answers of every
+    # result snapshot are flattened into votes/owners, the voters recorded by the ledger into
+    # voters/ballots, sorted once into users/positions: everything after load() is a handful
+    # of vectorized numpy calls
+
+    def __init__(self) -> None:
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.timestamp = np.empty(0, dtype=np.int64)
+        self.status = np.empty(0, dtype=np.int8)
+        self.quorum = np.empty(0, dtype=np.int16)
+        self.majority = np.empty(0, dtype=np.int16)
+        self.total = np.empty(0, dtype=np.int64) # -1: no snapshot
+        self.eligible = np.empty(0, dtype=np.int64) # -1: not in the snapshot
+        self.tracked = np.empty(0, dtype=bool) # the ledger has every voter of the poll
+
+        self.votes = np.empty(0, dtype=np.int64) # votes of every answer of every snapshot
+        self.owners = np.empty(0, dtype=np.int64) # poll slot of each answer in votes
+
+        self.winner = np.empty(0, dtype=np.int64) # votes of the most voted answer of every poll
+
+        self.voters = np.empty(0, dtype=np.uint64) # users who voted, once per poll (single choice)
+        self.ballots = np.empty(0, dtype=np.int64) # poll slot of each user in voters
+        self.users = np.empty(0, dtype=np.uint64) # every user in voters, sorted
+        self.positions = np.empty(0, dtype=np.intp) # position in users of each user in voters
+
+    @classmethod
+    def load(cls, history, ledger=None, page: int=STATS_PAGE):
+
+        columns = cls()
+        for _ in columns.walk(history, ledger, page):
+            pass
+        columns.build()
+
+        return columns
+
+    @classmethod
+    async def load_async(cls, history, ledger=None, page: int=STATS_PAGE):
+
+        # the history and the ledger belong to the event loop, a thread can't walk them
+        # while votes come in: the loop gets its turn after every page instead. the arrays
+        # are built on a worker thread, from lists nobody else sees
+        columns = cls()
+        for _ in columns.walk(history, ledger, page):
+            await asyncio.sleep(0)
+        await asyncio.to_thread(columns.build)
+
+        return columns
+
+    def walk(self, history, ledger=None, page: int=STATS_PAGE):
+
+        # a single walk of the history through its pages, works with every backend. yields
+        # after every page, build() turns what it collected into the columns
+        ids, timestamp, status, quorum, majority = [], [], [], [], []
+        total, eligible, tracked, answers, cast = [], [], [], [], []
+        votes, voters = [], []
+        polls = ledger.polls if ledger is not None else {}
+        self.collected = (
+            ids, timestamp, status, quorum, majority, total, eligible, tracked, answers, cast,
+            votes, voters
+        )
+
+        entries = history.page_at(limit=page)
+        while entries:
+            for id, entry in entries:
+                ids.append(int(id))
+                timestamp.append(entry.timestamp)
+                status.append(entry.status)
+                quorum.append(entry.quorum)
+                majority.append(entry.majority)
+
+                results = entry.results
+                if results is None:
+                    total.append(-1)
+                    eligible.append(-1)
+                    tracked.append(False)
+                    answers.append(0)
+                    cast.append(0)
+                    continue
+
+                total.append(results["total"])
+                eligible.append(results.get("eligible", -1))
+                answers.append(len(results["answers"]))
+                votes.extend(answer["votes"] for answer in results["answers"])
+
+                # the ledger keeps an array('Q') per answer, their raw bytes are joined below
+                poll = polls.get(entry.message)
+                if poll is not None and poll["synced"] is not None:
+                    tracked.append(True)
+                    voters.extend(poll["answers"].values())
+                    cast.append(sum(len(answer) for answer in poll["answers"].values()))
+                else:
+                    tracked.append(False)
+                    cast.append(0)
+
+            yield
+            entries = history.page_after(entries[-1][0], limit=page)
+
+    def build(self):
+
+        (
+            ids, timestamp, status, quorum, majority, total, eligible, tracked, answers, cast,
+            votes, voters
+        ) = self.collected
+        del self.collected
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.timestamp = np.array(timestamp, dtype=np.int64)
+        self.status = np.array(status, dtype=np.int8)
+        self.quorum = np.array(quorum, dtype=np.int16)
+        self.majority = np.array(majority, dtype=np.int16)
+        self.total = np.array(total, dtype=np.int64)
+        self.eligible = np.array(eligible, dtype=np.int64)
+        self.tracked = np.array(tracked, dtype=bool)
+
+        slots = np.arange(len(ids), dtype=np.int64)
+        self.votes = np.array(votes, dtype=np.int64)
+        self.owners = np.repeat(slots, answers)
+
+        # most voted answer of every poll, the answers of a poll are contiguous
+        self.winner = np.zeros(len(ids), dtype=np.int64)
+        if len(self.votes):
+            starts = np.flatnonzero(np.r_[True, self.owners[1:]!=self.owners[:-1]])
+            self.winner[self.owners[starts]] = np.maximum.reduceat(self.votes, starts)
+
+        # closed polls take no more votes, their arrays don't change under the thread
+        self.voters = np.frombuffer(b"".join(voters), dtype=np.uint64)
+        self.ballots = np.repeat(slots, cast)
+
+        # the sort of the voters is paid once here: a query only counts positions
+        self.users, self.positions = np.unique(self.voters, return_inverse=True)
+
+    def __len__(self):
+
+        return len(self.ids)
+
+#endregion
+
+#region STATISTICS
+
+def poll_stats(
+    columns: PollColumns,
+    members: set,
+    start: datetime | None=None,
+    end: datetime | None=None,
+    top: int=STATS_TOP
+):
+
+    # turnout, majority and quorum rates over the polls created in [start, end), and how
+    # often each current member voted in the polls the ledger has voters for
+    selected = np.ones(len(columns), dtype=bool)
+    if start is not None:
+        selected &= columns.timestamp>=int(start.timestamp())
+    if end is not None:
+        selected &= columns.timestamp<int(end.timestamp())
+
+    stats = {
+        "polls": int(selected.sum()),
+        "open": int((selected & (columns.status==PollStatus.OPEN)).sum()),
+        "closed": int((selected & (columns.status==PollStatus.CLOSED)).sum()),
+        "deleted": int((selected & (columns.status==PollStatus.DELETED)).sum())
+    }
+
+    # only closed polls with a snapshot have final results
+    final = selected & (columns.status==PollStatus.CLOSED) & (columns.total>=0)
+    stats["final"] = int(final.sum())
+
+    reached = columns.winner>columns.majority/100*columns.total
+    stats["majority"] = float(reached[final].mean()) if final.any() else None
+
+    # older snapshots don't know how many members could vote
+    counted = final & (columns.eligible>0)
+    eligible = np.where(counted, columns.eligible, 1)
+    stats["turnout"] = float((columns.total/eligible)[counted].mean()) if counted.any() else None
+    stats["quorum"] = \
+        float((columns.total>columns.quorum/100*eligible)[counted].mean()) if counted.any() else None
+
+    stats.update(member_stats(columns, final, members, top))
+
+    return stats
+
+def member_stats(columns: PollColumns, final: np.ndarray, members: set, top: int):
+
+    tracked = columns.tracked & final
+    polls = int(tracked.sum())
+    if not polls or not members:
+        return {"tracked": polls, "participation": None, "never": None, "top": []}
+
+    # polls voted by every user: the bot's polls are single choice, so a user shows up once
+    # per poll and counting is a bincount over the positions computed by build()
+    counts = np.bincount(columns.positions[tracked[columns.ballots]], minlength=len(columns.users))
+
+    # then the current members are looked up among the users, members who never voted get 0
+    electorate = np.sort(np.fromiter(members, dtype=np.uint64, count=len(members)))
+    voted = np.zeros(len(electorate), dtype=np.int64)
+    if len(columns.users):
+        found = np.minimum(np.searchsorted(columns.users, electorate), len(columns.users)-1)
+        hit = columns.users[found]==electorate
+        voted[hit] = counts[found[hit]]
+
+    rate = voted/polls
+    order = np.argsort(-rate, kind="stable")[:top]
+
+    return {
+        "tracked": polls,
+        "participation": float(rate.mean()),
+        "never": int((voted==0).sum()),
+        "top": [(int(electorate[i]), float(rate[i])) for i in order if voted[i]]
+    }
+
+#endregion
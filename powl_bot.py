@@ -5,227 +5,1162 @@
 
 from datetime import datetime, timedelta
 import os
+import time
+import asyncio
+import io
+import csv
 import json
+import shutil
+import sqlite3
+import zipfile
+import tempfile
 import discord
 import logging
 from logging.handlers import RotatingFileHandler
 from discord import ui
-from discord.ext import commands
-from typing import List
+from discord.ext import tasks, commands
+from typing import Callable, List, Literal
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from persistence import FileLock, JsonWriter
+from cluster import ClusterBot, log_file
+from dispatch import Dispatcher, Priority
+from poll_stats import PollColumns, poll_stats
+from views import VIEW_IDLE, PersistentView, ViewRoute
+from poll_history import (
+    PollStatus,
+    PollArchive,
+    PollHistory,
+    PollHistoryJournal,
+    PollHistorySqlite,
+    VoterLedger,
+    open_database
+)
+
+#endregion
+
+#region GLOBALS
+
+DEFAULT_OPTIONS = ["Indifferente", "Contrario a tutte le precedenti"]
+MAX_N_POLL = 10-len(DEFAULT_OPTIONS) #maximum amount of poll options supported by Discord
+MAX_DURATION = 7*24*3600 # maximum duration supported by Discord (7 days) 
+MAX_SELECT = 10
+EMBED_VALUE_LIMIT = 1024
+MESSAGE_LIMIT = 2000 # characters in a message
+BACKFILL_CONCURRENCY = 4 # poll answers whose voters are paged over the api at the same time
+BACKFILL_LIMIT = 2**63 # voters a crawl may page through, the empty page ends it first
+BACKFILL_PACE = 1.0 # seconds between two pages of the same answer
+BACKFILL_RESUME = 15*60 # an interrupted sync resumes from its checkpoints if younger than this
+BULK_CONCURRENCY = 4 # polls closed/deleted/exported at the same time by the bulk actions
+BULK_PROGRESS_EVERY = 1.0 # seconds between two updates of the bulk progress embed
+EXPORT_CONCURRENCY = 8 # polls fetched at the same time by /esporta-storico
+EXPORT_SPOOL = 8*1024**2 # archive bytes kept in memory before spilling to a temporary file
+EXPORT_FIELDS = [
+    "id", "creata", "scadenza", "stato", "canale", "messaggio", "thread", "domanda",
+    "maggioranza", "quorum", "opzione", "voti", "voti_totali", "maggioranza_raggiunta"
+]
+HISTORY_BACKEND = "journal" # one of "json" (full rewrite on every change), "journal", "sqlite"
+MAX_EXPIRY_SLEEP = 3600 # re-check the expiry schedule at least once an hour
+EXPIRY_RETRY = 60 # seconds before a guild whose expiries failed is tried again
+ARCHIVE_AFTER = 30*24*3600 # closed/deleted polls older than this move to the compressed archive
+GUILD_CACHE = 64 # guild partitions kept loaded, the least recently used ones are closed
+RESOLVER_TTL = 300 # seconds a fetched channel/message/thread is reused for
+RESOLVER_CACHE = 512 # fetched channels/messages/threads kept by the resolver
+RENDER_CACHE = 256 # /gestisci embeds kept by the render cache
+METRICS_EVERY = 15 # minutes between two lines of metrics in the log
+STATS_CACHE = 4 # /statistiche columns kept, one per guild and version of its history
+
+token = #...
+handler = RotatingFileHandler(
+    filename=log_file('discord_powl_bot.log'),
+    encoding='utf-8',
+    mode='a',
+    maxBytes=5*1024**2,
+    backupCount=3
+)
+logger = logging.getLogger("discord")
+
+intents = discord.Intents.default()
+intents.message_content = True
+intents.members = True
+intents.guilds = True
+
+#endregion
+
+#region SETTINGS
+
+class PollSettings:
+
+    def __init__(self,f: str) -> None:
+
+        self.f = f
+        self.channel = None
+        self.majority = None
+        self.quorum = None
+        self.duration = None
+        
+        self.load()
+
+        self.writer = JsonWriter(self.f, self.to_dict)
+
+    def load(self):
+
+        if not os.path.exists(self.f):
+            with open(self.f, "w") as _:
+                pass
+        else:
+            try:
+                with open(self.f, "r") as f:
+                    settings = json.load(f)
+
+                for key in settings:
+                    self.__setattr__(key, settings[key])
+            except json.decoder.JSONDecodeError:
+                return {}
+
+    def to_dict(self):
+
+        return {
+            key: value for key, value in self.__dict__.items() 
+            if key not in ["f", "writer", "connection"]
+        }
+
+    def dump(self):
+
+        self.writer.schedule()
+
+    async def flush(self):
+
+        await self.writer.flush()
+
+    def close(self):
+
+        self.writer.close()
+
+
+class PollSettingsSqlite(PollSettings):
+
+    def __init__(self, f: str, connection: sqlite3.Connection) -> None:
+
+        self.connection = connection # set before PollSettings.__init__ calls load()
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+        super().__init__(f)
+
+    def load(self):
+
+        rows = self.connection.execute("SELECT key, value FROM settings").fetchall()
+        if not rows:
+            # import the legacy json settings, if any
+            super().load()
+
+            return
+        
+        for row in rows:
+            self.__setattr__(row["key"], json.loads(row["value"]))
+
+    def dump(self):
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in self.to_dict().items()]
+            )
+
+#endregion
+
+#region PARTITIONS
+
+class GuildPartition:
+
+    # history and settings of a single guild, laid out in its own directory the way
+    # the whole bot used to be in .pollbot
+
+    def __init__(self, path: str) -> None:
+
+        self.path = path
+        self.fhistory = f"{self.path}/poll_history.json"
+        self.fsettings = f"{self.path}/poll_settings.json"
+        self.fdatabase = f"{self.path}/pollbot.sqlite3"
+        self.farchive = f"{self.path}/archive"
+        self.fvoters = f"{self.path}/poll_voters.json"
+        self.database = None
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        self.ledger = VoterLedger(self.fvoters)
+
+        if HISTORY_BACKEND=="sqlite":
+            # a partition switching from json still has its archived polls in the segments
+            archive = PollArchive(self.farchive) if os.path.exists(self.farchive) else None
+            self.database = open_database(self.fdatabase)
+            self.history = PollHistorySqlite(self.fhistory, self.database, archive=archive)
+            self.settings = PollSettingsSqlite(self.fsettings, self.database)
+        else:
+            archive = PollArchive(self.farchive)
+            if HISTORY_BACKEND=="journal":
+                self.history = PollHistoryJournal(self.fhistory, archive=archive)
+            else:
+                self.history = PollHistory(self.fhistory, archive=archive)
+            self.settings = PollSettings(self.fsettings)
+
+    async def flush(self):
+
+        await self.history.flush()
+        await self.settings.flush()
+        await self.ledger.flush()
+
+    def close(self):
+
+        self.history.close()
+        self.settings.close()
+        self.ledger.close()
+        if self.database is not None:
+            self.database.close()
+            self.database = None
+
+
+class GuildPartitions:
+
+    # guild id -> GuildPartition, loaded on first use and kept in an lru cache. the manifest
+    # keeps the next expiry of every guild, so the expiry scheduler never has to load the
+    # guilds without open polls. in a cluster every process keeps the guilds of its shards
+    # (owns), the manifest is shared: a process only ever writes the guilds it touched
+
+    def __init__(
+        self,
+        path: str,
+        cache_size: int=GUILD_CACHE,
+        owns: Callable[[int], bool]=lambda guild: True
+    ) -> None:
+
+        self.path = path
+        self.fmanifest = f"{path}/manifest.json"
+        self.cache_size = cache_size
+        self.owns = owns
+        self.partitions = OrderedDict()
+        self.held = Counter() # partitions in use across an await, never evicted
+        self.touched = set() # guilds whose expiry this process wrote
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        self.writer = JsonWriter(self.fmanifest, self.changes, merge=self.merge)
+
+        # guild id -> next expiry (epoch) of its open polls, it may run early but never late.
+        # older versions could write a "None" guild from commands used in dms
+        self.expiries = {
+            key: expiry for key, expiry in (self.writer.load() or {}).items()
+            if key.isdigit() and self.owns(int(key))
+        }
+
+    def changes(self):
+
+        # every guild touched since startup, a snapshot written late is never missing any
+        return {
+            "expiries": {key: self.expiries[key] for key in self.touched if key in self.expiries},
+            "removed": [key for key in self.touched if key not in self.expiries]
+        }
+
+    def merge(self, manifest: dict | None, changes: dict):
+
+        manifest = manifest or {}
+        for key in changes["removed"]:
+            manifest.pop(key, None)
+        manifest.update(changes["expiries"])
+
+        return manifest
+
+    def store(self, key: str, expiry: float | None):
+
+        self.expiries[key] = expiry
+        self.touched.add(key)
+        self.writer.schedule()
+
+    def get(self, guild: int):
+
+        # dms have no guild, and no partition
+        if guild is None:
+            raise ValueError("Guild partitions need a guild id.")
+
+        key = str(guild)
+        if key in self.partitions:
+            self.partitions.move_to_end(key)
+
+            return self.partitions[key]
+
+        partition = GuildPartition(f"{self.path}/{key}")
+        self.partitions[key] = partition
+        if key not in self.expiries:
+            self.store(key, partition.history.next_expiry())
+
+        self.shrink()
+
+        return partition
+
+    @contextmanager
+    def hold(self, guild: int):
+
+        key = str(guild)
+        self.held[key] += 1
+        try:
+            yield self.get(guild)
+        finally:
+            self.held[key] -= 1
+            if not self.held[key]:
+                del self.held[key]
+
+            self.shrink()
+
+    def shrink(self):
+
+        for key in list(self.partitions):
+            if len(self.partitions)<=self.cache_size:
+                break
+
+            if key not in self.held:
+                self.release(key)
+
+    def release(self, key: str):
+
+        partition = self.partitions.pop(key)
+        self.store(key, partition.history.next_expiry())
+        partition.close()
+
+    def schedule(self, guild: int):
+
+        # to be called after the open polls of a guild change
+        self.store(str(guild), self.get(guild).history.next_expiry())
+
+    def due(self):
+
+        now = time.time()
+
+        return [
+            int(key) for key, expiry in self.expiries.items()
+            if expiry is not None and expiry<=now
+        ]
+
+    def next_expiry(self):
+
+        return min((expiry for expiry in self.expiries.values() if expiry is not None), default=None)
+
+    def known(self):
+
+        return [int(key) for key in self.expiries]
+
+    def with_open_polls(self):
+
+        return [int(key) for key, expiry in self.expiries.items() if expiry is not None]
+
+    def has_open_polls(self, guild: int):
+
+        # without loading the guild: only open polls take votes
+        return self.expiries.get(str(guild)) is not None
+
+    def reset(self, guild: int):
+
+        key = str(guild)
+        if key in self.partitions:
+            self.partitions.pop(key).close()
+
+        path = f"{self.path}/{key}"
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+        self.expiries.pop(key, None)
+        self.touched.add(key)
+        self.writer.schedule()
+
+    async def share(self):
+
+        # the guilds of the other processes that this one wrote (a migration) go to the
+        # manifest and out of this process, the guilds they wrote meanwhile come in
+        for key in [key for key in self.partitions if not self.owns(int(key))]:
+            self.release(key)
+
+        await self.writer.flush()
+
+        self.touched = {key for key in self.touched if self.owns(int(key))}
+        manifest = self.writer.load() or {}
+        self.expiries = {
+            key: expiry for key, expiry in manifest.items()
+            if key.isdigit() and self.owns(int(key)) and key not in self.touched
+        } | {key: self.expiries[key] for key in self.touched if key in self.expiries}
+
+    async def flush(self):
+
+        for partition in list(self.partitions.values()):
+            await partition.flush()
+
+        await self.writer.flush()
+
+    def close(self):
+
+        for key in list(self.partitions):
+            self.release(key)
+
+        self.writer.close()
+
+#endregion
+
+#region RESOLVER
+
+class PollResolver:
+
+    # channels, threads and poll messages of the history: the gateway cache first, then
+    # whatever was fetched in the last RESOLVER_TTL seconds, then the api. poll messages
+    # are dropped from the cache as soon as a vote, edit or deletion makes them stale
+
+    def __init__(
+        self,
+        client: discord.Client,
+        ttl: float=RESOLVER_TTL,
+        cache_size: int=RESOLVER_CACHE
+    ) -> None:
+
+        self.client = client
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # snowflake -> (deadline, object)
+
+    def cached(self, id: int):
+
+        if id not in self.cache:
+            return None
+
+        deadline, obj = self.cache[id]
+        if deadline<time.monotonic():
+            del self.cache[id]
+
+            return None
+
+        self.cache.move_to_end(id)
+
+        return obj
+
+    def store(self, id: int, obj):
+
+        self.cache[id] = (time.monotonic()+self.ttl, obj)
+        self.cache.move_to_end(id)
+        if len(self.cache)>self.cache_size:
+            self.cache.popitem(last=False)
+
+        return obj
+
+    def invalidate(self, id: int):
+
+        self.cache.pop(id, None)
+
+    def clear(self):
+
+        self.cache.clear()
+
+    async def channel(self, id: int):
+
+        # threads included
+        channel = self.client.get_channel(id) or self.cached(id)
+        if channel is None:
+            channel = self.store(id, await self.client.fetch_channel(id))
+
+        return channel
+
+    def messageable(self, id: int, guild: int):
+
+        # enough to fetch messages from and to mention, without an api call
+        return self.client.get_channel(id) or self.client.get_partial_messageable(id, guild_id=guild)
+
+    async def message(self, channel: discord.abc.Messageable, id: int):
+
+        # messages seen on the gateway get their poll counts updated by the vote events
+        message = discord.utils.get(self.client.cached_messages, id=id) or self.cached(id)
+        if message is None:
+            message = self.store(id, await channel.fetch_message(id))
+
+        return message
+
+#endregion
+
+#region RENDER
+
+class RenderCache:
+
+    # built /gestisci embeds. the key of an embed carries the versions of everything it was
+    # built from, so a change never needs to find and evict the embeds it affects: their keys
+    # are simply never asked for again and they age out of the lru
+
+    def __init__(self, cache_size: int=RENDER_CACHE) -> None:
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # key -> embed
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+
+        embed = self.cache.get(key)
+        if embed is None:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+        self.cache.move_to_end(key)
+
+        return embed
+
+    def store(self, key: tuple, embed: discord.Embed):
+
+        self.cache[key] = embed
+        self.cache.move_to_end(key)
+        if len(self.cache)>self.cache_size:
+            self.cache.popitem(last=False)
+
+        return embed
+
+    def metrics(self):
+
+        requests = self.hits+self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "ratio": self.hits/requests if requests else 0.0,
+            "size": len(self.cache)
+        }
+
+#endregion
+
+#region MEMBERS
+
+class MemberIndex:
+
+    # guild id -> ids of its human members, the electorate of the guild's polls. built from
+    # the gateway member cache the first time a guild is asked for, then kept current by the
+    # member events, so quorums and non-voters never walk the member list again
+
+    def __init__(self, client: discord.Client) -> None:
+
+        self.client = client
+        self.guilds = {}
+        self.versions = Counter() # guild id -> changes to its electorate
+
+    def version(self, guild: int):
+
+        return self.versions[guild]
+
+    def get(self, guild: int):
+
+        if guild in self.guilds:
+            return self.guilds[guild]
+
+        cached = self.client.get_guild(guild)
+        members = {member.id for member in cached.members if not member.bot} if cached else set()
+
+        # not indexed until the member list is complete, or the missing members never show up
+        if cached is not None and cached.chunked:
+            self.guilds[guild] = members
+
+        return members
+
+    def update(self, member: discord.Member):
+
+        members = self.guilds.get(member.guild.id)
+        if members is None:
+            return
+
+        # profile updates are the most frequent member event and change nothing here
+        count = len(members)
+        if member.bot:
+            members.discard(member.id)
+        else:
+            members.add(member.id)
+        if len(members)!=count:
+            self.versions[member.guild.id] += 1
+
+    def remove(self, guild: int, user: int):
+
+        members = self.guilds.get(guild)
+        if members is not None:
+            members.discard(user)
+            self.versions[guild] += 1
+
+    def drop(self, guild: int):
+
+        self.guilds.pop(guild, None)
+        self.versions[guild] += 1
+
+#endregion
+
+#region BACKFILL
+
+class VoterBackfill:
+
+    # syncs the voter ledgers over the api: every open poll in the background after a new
+    # gateway session, any other poll the first time its voters are asked for. answers are
+    # paged BACKFILL_CONCURRENCY at a time, a page every BACKFILL_PACE seconds each, and every
+    # page is checkpointed in the ledger so a restart picks up where the sync stopped
+
+    def __init__(
+        self,
+        client: "PollBot",
+        concurrency: int=BACKFILL_CONCURRENCY,
+        pace: float=BACKFILL_PACE
+    ) -> None:
+
+        self.client = client
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pace = pace
+        self.crawls = {} # message id -> running sync
+        self.background = set() # messages synced because a session started, not because asked for
+        self.waiters = Counter() # message id -> callers waiting for its sync
+
+    def start(self, shard: int):
+
+        for guild in self.client.partitions.with_open_polls():
+            if self.client.shard_of(guild)!=shard:
+                continue
+
+            for id in self.client.history(guild).open_polls():
+                self.background.add(self.client.history(guild).get(id).message)
+                self.crawl(guild, id)
+
+    def crawl(self, guild: int, id: str):
+
+        message = self.client.history(guild).get(id).message
+        if message not in self.crawls:
+            self.crawls[message] = asyncio.create_task(self.run(guild, id, message))
+            self.crawls[message].add_done_callback(lambda _: self.crawls.pop(message, None))
+            self.crawls[message].add_done_callback(lambda _: self.background.discard(message))
+
+        return self.crawls[message]
+
+    async def wait(self, guild: int, id: str):
+
+        # a sync asked for is stopped once nobody waits for it anymore, its checkpoints let
+        # the next request resume it. callers giving up never cancel it for the others
+        task = self.crawl(guild, id)
+        message = self.client.history(guild).get(id).message
+
+        self.waiters[message] += 1
+        try:
+            await asyncio.shield(task)
+        finally:
+            self.waiters[message] -= 1
+            if not self.waiters[message]:
+                del self.waiters[message]
+                if not task.done() and message not in self.background:
+                    task.cancel()
+
+    async def run(self, guild: int, id: str, message: int):
+
+        try:
+            # nothing to do if it was synced during this session already
+            ledger = self.client.partitions.get(guild).ledger
+            if ledger.voters(message, self.client.connected_at(guild)) is not None:
+                return
+
+            # resolving the poll may hit the api too: it takes a turn like the pages do, or every
+            # open poll of the shard would be fetched at once
+            async with self.semaphore:
+                poll_entry = await self.client.retrieve_entry_from_history(guild, id)
+
+            self.client.partitions.get(guild).ledger.begin(message, time.time(), BACKFILL_RESUME)
+            await asyncio.gather(*[
+                self.crawl_answer(guild, message, option) for option in poll_entry.message.poll.answers
+            ])
+
+            self.client.partitions.get(guild).ledger.finish(message)
+        except Exception as e:
+            logger.exception(e)
+
+    async def crawl_answer(self, guild: int, message: int, option: discord.PollAnswer):
+
+        async with self.semaphore:
+            after = self.client.partitions.get(guild).ledger.checkpoint(message, option.id)
+
+            # without a limit the library stops after vote_count voters, which is stale by now:
+            # with BACKFILL_LIMIT it pages until the api returns an empty page
+            page = []
+            voters = option.voters(limit=BACKFILL_LIMIT, after=discord.Object(after) if after else None)
+            async for voter in voters:
+
+                # every page of the api is yielded backwards, an id going up starts the next one
+                if page and voter.id>page[-1]:
+                    self.client.partitions.get(guild).ledger.crawled(message, option.id, page)
+                    page = []
+
+                    # the library waits out 429s, pacing keeps the crawl from causing them
+                    await asyncio.sleep(self.pace)
+
+                page.append(voter.id)
+
+            self.client.partitions.get(guild).ledger.crawled(message, option.id, page)
+
+#endregion
+
+#region MENTIONS
+
+def format_mentions(users: list, limit: int=EMBED_VALUE_LIMIT):
+
+    mentions = [f"<@{user}>" for user in users]
+    fmt = ", ".join(mentions)
+    if len(fmt)<=limit:
+        return fmt
+
+    # as many mentions as fit next to the count of the ones left out
+    length = 0
+    for n, mention in enumerate(mentions):
+        length += len(mention)+(2 if n else 0)
+        if length+len(f" e altri {len(mentions)-n-1}")>limit:
+            return ", ".join(mentions[:n])+f" e altri {len(mentions)-n}"
+
+
+def chunk_mentions(users: list, suffix: str="", limit: int=MESSAGE_LIMIT):
+
+    # messages of comma separated mentions, each one followed by suffix and within limit
+    chunks, chunk = [], ""
+    for user in users:
+        mention = f"<@{user}>" if not chunk else f", <@{user}>"
+        if chunk and len(chunk)+len(mention)+len(suffix)>limit:
+            chunks.append(chunk+suffix)
+            chunk, mention = "", f"<@{user}>"
+
+        chunk += mention
+
+    if chunk:
+        chunks.append(chunk+suffix)
+
+    return chunks
+
+#endregion
+
+class PollBot(ClusterBot):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.path = ".pollbot"
+        self.fhistory = f"{self.path}/poll_history.json" # single-guild layout, migrated at startup
+        self.fsettings = f"{self.path}/poll_settings.json"
+        self.fdatabase = f"{self.path}/pollbot.sqlite3"
+        self.farchive = f"{self.path}/archive"
+        self.flegacy = f"{self.path}/legacy"
+        self.expiry_event = asyncio.Event() # wakes up the expiry scheduler
+        self.resolver = PollResolver(self)
+        self.electorate = MemberIndex(self)
+        self.renders = RenderCache()
+        self.columns = RenderCache(STATS_CACHE) # the date range changes, the columns don't
+        self.backfill = VoterBackfill(self)
+        self.dispatcher = Dispatcher() # outgoing messages, pins and pings
+        self.started = time.time()
+        self.sessions = {} # shard id -> start of its gateway session, see connected_at
+        
+        self.setup()
+
+    def setup(self):
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        self.partitions = GuildPartitions(f"{self.path}/guilds", owns=self.owns)
+
+    def history(self, guild: int):
+
+        # never keep the result across an await, the partition may be evicted meanwhile
+        return self.partitions.get(guild).history
+
+    def settings(self, guild: int):
+
+        return self.partitions.get(guild).settings
+    
+    def reset(self, guild: int):
+
+        self.partitions.reset(guild)
+        self.expiry_event.set()
+
+    async def migrate(self):
+
+        # split the single-guild history and settings of older versions by guild, polls
+        # registered before entries carried their guild are resolved through their channel
+        legacy = [f for f in [self.fhistory, self.fsettings, self.fdatabase] if os.path.exists(f)]
+        if not legacy:
+            return
+
+        archive = PollArchive(self.farchive) if os.path.exists(self.farchive) else None
+        if os.path.exists(self.fdatabase):
+            database = open_database(self.fdatabase)
+            history = PollHistorySqlite(self.fhistory, database, archive=archive)
+            settings = PollSettingsSqlite(self.fsettings, database)
+        else:
+            database = None
+            history = PollHistoryJournal(self.fhistory, archive=archive)
+            settings = PollSettings(self.fsettings)
+
+        channels = {}
+        async def resolve(channel: int | None):
+
+            if channel is not None and channel not in channels:
+                try:
+                    channels[channel] = (await self.fetch_channel(channel)).guild.id
+                except discord.HTTPException:
+                    channels[channel] = None
+
+            return channels.get(channel)
+
+        # polls whose channel is gone go to the guild of the default channel, or to the
+        # only guild the bot is in
+        fallback = await resolve(settings.channel)
+        if fallback is None:
+            guilds = [guild async for guild in self.fetch_guilds(limit=2)]
+            if len(guilds)==1:
+                fallback = guilds[0].id
+
+        partitions = {}
+        page = history.page_at(limit=1000)
+        while page:
+            for id, entry in page:
+                guild = entry.guild or await resolve(entry.channel) or fallback
+                if guild is None:
+                    logger.warning(f"Poll {id} has no guild, left in {self.flegacy}.")
+                    continue
+
+                entry.guild = guild
+                partitions.setdefault(guild, []).append((id, entry))
+
+            page = history.page_after(page[-1][0], limit=1000)
+
+        for guild, entries in partitions.items():
+            self.history(guild).restore(entries)
+            self.partitions.schedule(guild)
+
+        if fallback is not None:
+            target = self.settings(fallback)
+            for key, value in settings.to_dict().items():
+                setattr(target, key, value)
+            target.dump()
+
+        history.close()
+        settings.close()
+        if database is not None:
+            database.close()
+
+        if not os.path.exists(self.flegacy):
+            os.makedirs(self.flegacy)
+
+        for f in os.listdir(self.path):
+            if f not in ["guilds", "legacy"] and not f.endswith(".lock"):
+                os.replace(os.path.join(self.path, f), os.path.join(self.flegacy, f))
+
+        logger.info(f"Legacy history split into {len(partitions)} guild(s).")
+
+    async def setup_hook(self):
+
+        # in a cluster one process migrates, the others find the history already split
+        async with FileLock(f"{self.path}/migrate.lock"):
+            await self.migrate()
+            await self.partitions.share()
+
+        # clicks on menus dropped for idleness or sent before a restart
+        self.add_dynamic_items(ViewRoute)
+
+        self.expiry_task = asyncio.create_task(self.watch_expiries())
+        self.archive_polls.start()
+        self.report_metrics.start()
+
+    @tasks.loop(hours=24)
+    async def archive_polls(self):
+
+        # one guild at a time, the cache never holds more than usual
+        for guild in self.partitions.known():
+            with self.partitions.hold(guild) as partition:
+                archived = await partition.history.archive_closed(ARCHIVE_AFTER)
+
+            if archived:
+                logger.info(f"{archived} polls of guild {guild} moved to the archive.")
+
+    @archive_polls.before_loop
+    async def before_archive_polls(self):
+
+        await self.wait_until_ready()
+
+    @archive_polls.error
+    async def archive_polls_error(self, error: Exception):
+
+        logger.exception(error)
+
+    @tasks.loop(minutes=METRICS_EVERY)
+    async def report_metrics(self):
+
+        # a line in the log, for whoever is watching the bot under load
+        metrics = {
+            "dispatcher": self.dispatcher.metrics(),
+            "renders": self.renders.metrics(),
+            "statistics": self.columns.metrics(),
+            "views": PersistentView.gauge()
+        }
+        logger.info(f"Metrics: {json.dumps(metrics)}")
+
+    @report_metrics.before_loop
+    async def before_report_metrics(self):
+
+        await self.wait_until_ready()
+
+    @report_metrics.error
+    async def report_metrics_error(self, error: Exception):
+
+        logger.exception(error)
+
+    async def close(self):
+
+        await self.partitions.flush()
+        self.dispatcher.close()
+        await super().close()
+    
+    def connected_at(self, guild: int):
+
+        # votes on the polls of the guild before this were not seen on the gateway
+        return self.sessions.get(self.shard_of(guild), self.started)
+
+    async def on_shard_ready(self, shard_id: int):
+
+        # a new session of the shard (not a resume): votes cast meanwhile were missed by the
+        # ledgers of its guilds. on_ready only comes once, for all the shards together
+        self.sessions[shard_id] = time.time()
+
+        # the events that would have made the cached poll messages stale were missed too
+        self.resolver.clear()
+        self.backfill.start(shard_id)
+
+    async def on_ready(self):
+
+        print("BOT READY")
+
+        # the commands are global, in a cluster a single process syncs them
+        if not self.primary:
+            return
+
+        try:
+            sync = await bot.tree.sync()
+            print(f"SYNCHED {len(sync)} COMMAND(S)")
+        except Exception as e:
+            logger.exception(e)
 
-#endregion
+    async def on_raw_poll_vote_add(self, payload: discord.RawPollVoteActionEvent):
 
-#region GLOBALS
+        self.resolver.invalidate(payload.message_id)
 
-POLL_STATUS = ["*APERTA*", "*CHIUSA*", "*ELIMINATA*"]
-DEFAULT_OPTIONS = ["Indifferente", "Contrario a tutte le precedenti"]
-MAX_N_POLL = 10-len(DEFAULT_OPTIONS) #maximum amount of poll options supported by Discord
-MAX_DURATION = 7*24*3600 # maximum duration supported by Discord (7 days) 
-MAX_SELECT = 10
-EMBED_VALUE_LIMIT = 1024
+        ledger = self.poll_ledger(payload)
+        if ledger is not None:
+            ledger.add(payload.message_id, payload.answer_id, payload.user_id)
 
-token = #...
-handler = RotatingFileHandler(
-    filename='discord_powl_bot.log',
-    encoding='utf-8',
-    mode='a',
-    maxBytes=5*1024**2,
-    backupCount=3
-)
-logger = logging.getLogger("discord")
+    async def on_raw_poll_vote_remove(self, payload: discord.RawPollVoteActionEvent):
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-intents.guilds = True
+        self.resolver.invalidate(payload.message_id)
 
-#endregion
+        ledger = self.poll_ledger(payload)
+        if ledger is not None:
+            ledger.remove(payload.message_id, payload.answer_id, payload.user_id)
 
-#region HISTORY
+    def poll_ledger(self, payload: discord.RawPollVoteActionEvent):
 
-class PollHistoryEntry:
+        # the voter ledger of the guild, if the vote is on one of our polls. votes in guilds
+        # without open polls of ours are told apart without loading their partition
+        if payload.guild_id is None or not self.partitions.has_open_polls(payload.guild_id):
+            return None
 
-    def __init__(
-        self,
-        timestamp: str | datetime,
-        duration: float | timedelta,
-        quorum: int,
-        majority: int,
-        channel: int | discord.TextChannel,
-        message: int| discord.Message,
-        thread: int | discord.Thread,
-        status: str
-    ) -> None:
-        
-        self.timestamp = timestamp
-        self.duration = duration
-        self.quorum = quorum
-        self.majority = majority
-        self.channel = channel
-        self.message = message
-        self.thread = thread
-        self.status = status
-        
+        partition = self.partitions.get(payload.guild_id)
+        if partition.history.find_by_message(payload.message_id) is None:
+            return None
 
-class PollHistory:
+        return partition.ledger
 
-    def __init__(self, f: str) -> None:
+    async def retrieve_voters(self, guild: int, id: str):
 
-        self.f = f
-        self.database = self.load()
+        # from the ledger, waiting for (or starting) its sync if it wasn't synced during
+        # this gateway session
+        message = self.history(guild).get(id).message
+        voters = self.partitions.get(guild).ledger.voters(message, self.connected_at(guild))
+        if voters is not None:
+            return voters
 
-    def load(self):
+        await self.backfill.wait(guild, id)
 
-        if not os.path.exists(self.f):
-            with open(self.f, "w") as _:
-                return {}
-        else:
-            with open(self.f, "r") as f:
-                try:
-                    return json.load(f)
-                except json.decoder.JSONDecodeError:
-                    return {}
+        # a failed sync leaves only what the vote events gathered: pings and non-voters
+        # worked out from that would name members who did vote
+        voters = self.partitions.get(guild).ledger.voters(message, self.connected_at(guild))
+        if voters is None:
+            raise RuntimeError(f"Voters of poll {id} of guild {guild} could not be synced.")
 
+        return voters
 
-    def dump(self):
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
 
-        with open(self.f, "w") as f:
-            json.dump(self.database, f, indent=4)
-    
-    def register(
-        self,
-        time: datetime,
-        duration: timedelta,
-        quorum: int,
-        majority: int,
-        channel: discord.TextChannel,
-        message: discord.Message,
-        thread: discord.Thread,
-        status: str
-    ):
-        
-        payload = {
-            "timestamp": time.isoformat(),
-            "duration": duration.total_seconds(),
-            "quorum": quorum,
-            "majority": majority,
-            "channel": channel.id,
-            "message": message.id,
-            "thread": thread.id,
-            "status": status
-        }
-        
-        self.database[str(len(self.database)+1)] = payload
-        self.dump()
-        
-    def retrieve(self, id):
+        self.resolver.invalidate(payload.message_id)
 
-        return PollHistoryEntry(**self.database[id])
-    
-    def update(self, id: str | None=None, status: int | None=None):
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
 
-        for _, entry in self.database.items():
-            if entry["status"]!=POLL_STATUS[0]:
-                continue 
+        self.resolver.invalidate(payload.message_id)
 
-            start = datetime.fromisoformat(entry["timestamp"])
-            duration = timedelta(seconds=entry["duration"])
-            
-            if datetime.now()>=start+duration:
-                entry["status"] = POLL_STATUS[1] 
-        
-        if id is not None and status is not None:
-            self.database[id]["status"] = POLL_STATUS[status]
-            self.dump()
+    async def on_member_join(self, member: discord.Member):
 
-#endregion
+        self.electorate.update(member)
 
-#region SETTINGS
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
 
-class PollSettings:
+        self.electorate.update(after)
 
-    def __init__(self,f: str) -> None:
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
 
-        self.f = f
-        self.channel = None
-        self.majority = None
-        self.quorum = None
-        self.duration = None
-        
-        self.load()
+        self.electorate.remove(payload.guild_id, payload.user.id)
 
-    def load(self):
+    async def on_guild_remove(self, guild: discord.Guild):
 
-        if not os.path.exists(self.f):
-            with open(self.f, "w") as _:
-                pass
-        else:
-            try:
-                with open(self.f, "r") as f:
-                    settings = json.load(f)
+        self.electorate.drop(guild.id)
 
-                for key in settings:
-                    self.__setattr__(key, settings[key])
-            except json.decoder.JSONDecodeError:
-                return {}
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent):
 
-    def dump(self):
+        self.resolver.invalidate(payload.thread_id)
 
-        settings = {key: value for key, value in self.__dict__.items() if key!="f"}
-        with open(self.f, "w") as f:
-            json.dump(settings, f, indent=4)
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
 
-#endregion
+        self.resolver.invalidate(channel.id)
 
-class PollBot(commands.Bot):
+    async def retrieve_entry_from_history(self, guild: int, id: str):
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+        entry = self.history(guild).retrieve(id)
+        entry.channel = self.resolver.messageable(entry.channel, guild)
+        entry.message = await self.resolver.message(entry.channel, entry.message)
+        entry.thread = await self.resolver.channel(entry.thread)
 
-        self.path = ".pollbot"
-        self.fhistory = f"{self.path}/poll_history.json"
-        self.fsettings = f"{self.path}/poll_settings.json"
-        
-        self.setup()
+        return entry
 
-    def setup(self):
+    async def close_poll(self, guild: int, id: str, end: bool=True):
 
-        if not os.path.exists(self.path):
-            os.makedirs(self.path)
+        poll_entry = await self.retrieve_entry_from_history(guild, id)
+        poll = poll_entry.message.poll
+        if end:
+            poll = await poll.end()
 
-        self.history = PollHistory(self.fhistory)
-        self.settings = PollSettings(self.fsettings)
-    
-    def reset(self):
+        # from here on the poll is rendered and exported from this snapshot only
+        history = self.history(guild)
+        history.update(id=id, status=PollStatus.CLOSED)
+        history.set_results(id, self.tally(guild, poll_entry, poll) | {"closed": int(time.time())})
+        self.partitions.schedule(guild)
 
-        for f in os.listdir(self.path):
-            os.remove(os.path.join(self.path, f))
+        message = await self.dispatcher.send(
+            poll_entry.thread, content="La votazione è stata terminata."
+        )
+        await self.dispatcher.pin(message)
+
+    def tally(self, guild: int, poll_entry, poll: discord.Poll):
+
+        users = self.electorate.get(guild)
+        total = poll.total_votes
+
+        return {
+            "question": poll.question,
+            "answers": [
+                {
+                    "text": option.text,
+                    "votes": option.vote_count,
+                    "majority": option.vote_count>poll_entry.majority/100*total
+                } for option in poll.answers
+            ],
+            "total": total,
+            "eligible": len(users),
+            "quorum": total>poll_entry.quorum/100*len(users)
+        }
 
-        self.setup()
-    
-    async def on_ready(self):
-        
-        print("BOT READY")
+    async def delete_poll(self, guild: int, id: str):
 
-        try:
-            sync = await bot.tree.sync()
-            print(f"SYNCHED {len(sync)} COMMAND(S)")
-        except Exception as e:
-            logger.exception(e)
+        poll_entry = await self.retrieve_entry_from_history(guild, id)
+        await self.dispatcher.submit(("delete", poll_entry.channel.id), poll_entry.thread.delete)
+        await self.dispatcher.submit(("delete", poll_entry.channel.id), poll_entry.message.delete)
 
-    async def retrieve_entry_from_history(self, id: int):
+        self.history(guild).update(id=id, status=PollStatus.DELETED)
+        self.partitions.get(guild).ledger.discard(poll_entry.message.id)
+        self.partitions.schedule(guild)
 
-        entry = self.history.retrieve(id)
-        entry.channel = await self.fetch_channel(entry.channel)
-        entry.message = await entry.channel.fetch_message(entry.message)
-        entry.thread = await entry.message.fetch_thread()
+    async def bulk(self, guild: int, ids: list, action, progress=None):
 
-        return entry
+        # runs action(guild, id) over the polls BULK_CONCURRENCY at a time, the history
+        # changes are written once at the end. returns the ids that failed
+        semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+        done, failed = 0, []
+
+        async def run(id: str):
+
+            nonlocal done
+            async with semaphore:
+                try:
+                    await action(guild, id)
+                except Exception as e:
+                    logger.exception(e)
+                    failed.append(id)
+
+                done += 1
+                if progress is not None:
+                    await progress(done, failed)
+
+        with self.partitions.hold(guild) as partition, partition.history.batch():
+            await asyncio.gather(*[run(id) for id in ids])
+
+        return failed
+
+    async def watch_expiries(self):
+
+        # sleeps until the next poll deadline (or until a new poll is registered), then
+        # closes every poll that expired in the meantime
+        await self.wait_until_ready()
+
+        while not self.is_closed():
+            self.expiry_event.clear()
+
+            # only the guilds with a due poll get loaded. a guild that fails (a corrupt
+            # archive, a full disk) is logged and retried, the others keep closing
+            failed = False
+            try:
+                for guild in self.partitions.due():
+                    try:
+                        for id in self.history(guild).update():
+                            try:
+                                await self.close_poll(guild, id, end=False)
+                            except Exception as e:
+                                logger.exception(e)
+
+                        self.partitions.schedule(guild)
+                    except Exception as e:
+                        logger.exception(e)
+                        failed = True
+
+                next_expiry = self.partitions.next_expiry()
+            except Exception as e:
+                logger.exception(e)
+                failed, next_expiry = True, None
+
+            timeout = MAX_EXPIRY_SLEEP
+            if next_expiry is not None:
+                timeout = min(max(next_expiry-time.time(), 0), MAX_EXPIRY_SLEEP)
+            if failed:
+                # still due: without a pause the loop would spin on the same error
+                timeout = max(timeout, EXPIRY_RETRY)
+
+            try:
+                await asyncio.wait_for(self.expiry_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
     
-    async def retrieve_channel_from_settings(self):
+    async def retrieve_channel_from_settings(self, guild: int):
 
-        if self.settings.channel is not None:
-            return await self.fetch_channel(self.settings.channel)
+        channel = self.settings(guild).channel
+        if channel is not None:
+            return await self.resolver.channel(channel)
             
 
 bot = PollBot(command_prefix="$", intents=intents)
@@ -256,9 +1191,13 @@ async def help(interaction: discord.Interaction):
         "- `/gestisci`: mostra un'interfaccia che permette visualizzare e gestire tutte le votazioni"
         " lanciate con `/votazione`, per esempio chiudendo o cancellando la votazione, oppure"
         " esportando i voti su file, oppure ancora è possibile anche menzionare chi non ha ancora"
-        " votato. **NOTA BENE: una volta chiusa, non è più possibile esportare i dati di una"
-        " votazione**;"+"\n"
-        "- `/reset`: elimina le impostazioni correnti e i dati dei tutte le votazioni, riportando"
+        " votato. I risultati di una votazione vengono salvati al momento della chiusura, per"
+        " cui le votazioni chiuse restano consultabili ed esportabili;"+"\n"
+        "- `/esporta-storico`: esporta in un unico archivio .zip (CSV o JSONL) i risultati di"
+        " tutte le votazioni, oppure solo di quelle create in un intervallo di date;"+"\n"
+        "- `/statistiche`: mostra affluenza media, quante votazioni hanno raggiunto maggioranza"
+        " e quorum e quanto partecipa ogni membro, su tutto lo storico o in un intervallo di date;"+"\n"
+        "- `/reset`: elimina le impostazioni correnti e i dati dei tutte le votazioni del server, riportando"
         " il bot alla configurazione iniziale."+"\n"
         "\n"
         "Qui invece ci sono i comandi che possono essere invocati solo nel thread dedicato a una"
@@ -266,7 +1205,8 @@ async def help(interaction: discord.Interaction):
         "- `/id`: permette di ottenere l'ID della votazione, utile per il comando `/gestisci` se"
         " esistono molte votazioni nello storico;"+"\n"
         "- `/pinga`: menziona chi non ha ancora votato;"+"\n"
-        "- `/esporta`: esporta un file .csv contenente i dati della votazione.",
+        "- `/esporta`: esporta un file .csv contenente i dati della votazione (con `per_votante`,"
+        " una riga per ogni voto espresso).",
         ephemeral=True
     )
 
@@ -392,12 +1332,14 @@ class PollInterface(discord.Embed):
         return fmt
         
 
-class PollInterfaceEditor(ui.View):
+class PollInterfaceEditor(PersistentView, kind="votazione"):
+
+    # the draft lives in the view only: a dropped /votazione menu can't be restored
 
     def __init__(
         self, 
         *,
-        timeout: float | None=None, 
+        timeout: float | None=VIEW_IDLE, 
         poll_channel: discord.TextChannel | None=None,
         poll_majority: int | None=None,
         poll_quorum: int | None=None,
@@ -433,7 +1375,7 @@ class PollInterfaceEditor(ui.View):
     
     async def on_channel_select(self, interaction: discord.Interaction):
 
-        self.poll_channel = await bot.fetch_channel(self.select_channel.values[0].id)
+        self.poll_channel = await bot.resolver.channel(self.select_channel.values[0].id)
         await interaction.response.defer()
         
         self.enable_send()
@@ -444,7 +1386,8 @@ class PollInterfaceEditor(ui.View):
 
         modal = PollModal("Titolo", default=self.poll_title, is_title=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_title = modal.value
 
@@ -456,7 +1399,8 @@ class PollInterfaceEditor(ui.View):
 
         modal = PollModal("Opzione di voto", is_option=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_options.append(modal.value)
         
@@ -477,7 +1421,8 @@ class PollInterfaceEditor(ui.View):
 
         modal = PollModal("Maggioranza", default=self.poll_majority, is_majority=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_majority = modal.value
 
@@ -489,7 +1434,8 @@ class PollInterfaceEditor(ui.View):
 
         modal = PollModal("Quorum", default=self.poll_quorum, is_quorum=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_quorum = modal.value
 
@@ -501,7 +1447,8 @@ class PollInterfaceEditor(ui.View):
 
         modal = PollModal("Durata", default=self.poll_duration, is_duration=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_duration = modal.value
 
@@ -561,6 +1508,8 @@ class PollInterfaceEditor(ui.View):
 
         self.stop()
 
+        await _launch_poll(interaction, self)
+
     @ui.button(label="Cancella", style=discord.ButtonStyle.red, row=2)
     async def cancel(self, interaction: discord.Interaction, button: ui.Button):
         
@@ -587,9 +1536,10 @@ class PollModal(ui.Modal):
             is_option: bool=False,
             is_majority: bool=False,
             is_quorum: bool=False,
-            is_duration: bool=False
+            is_duration: bool=False,
+            is_id: bool=False
         ):
-        super().__init__(title=title)
+        super().__init__(title=title, timeout=VIEW_IDLE)
 
         if is_title:
             self.add_item(
@@ -641,6 +1591,16 @@ class PollModal(ui.Modal):
                 )
             )
 
+        if is_id:
+            self.add_item(
+                ui.TextInput(
+                    label="Digita l'ID della votazione",
+                    default=default,
+                    required=True,
+                    style=discord.TextStyle.short
+                )
+            )
+
     async def on_submit(self, interaction: discord.Interaction):
 
         self.value = self.children[0].value
@@ -648,37 +1608,8 @@ class PollModal(ui.Modal):
         await interaction.response.defer()
 
 
-@bot.tree.command(
-    name="votazione",
-    description="Crea una nuova votazione"
-)
-@commands.has_permissions(administrator=True)
-async def make_poll(interaction: discord.Interaction):
-
-    poll_channel = await bot.retrieve_channel_from_settings()
-    poll_majority = bot.settings.majority
-    poll_quorum = bot.settings.quorum
-    poll_duration = bot.settings.duration
-        
-    interface = PollInterface(
-        poll_channel=poll_channel,
-        poll_majority=poll_majority,
-        poll_quorum=poll_quorum,
-        poll_duration=poll_duration
-    )
-    editor = PollInterfaceEditor(
-        poll_channel=poll_channel,
-        poll_majority=poll_majority,
-        poll_quorum=poll_quorum,
-        poll_duration=poll_duration
-    )
-
-    await interaction.response.send_message(embed=interface, view=editor, ephemeral=True)
-    await editor.wait()
+async def _launch_poll(interaction: discord.Interaction, editor: PollInterfaceEditor):
 
-    if editor.is_cancelled:
-        return
-    
     poll = discord.Poll(
         question=editor.poll_title,
         duration=editor.poll_duration
@@ -686,20 +1617,28 @@ async def make_poll(interaction: discord.Interaction):
     for option in editor.poll_options:
         poll.add_answer(text=option)
 
-    message = await editor.poll_channel.send(
+    message = await bot.dispatcher.send(
+        editor.poll_channel,
+        priority=Priority.INTERACTION,
         content=f"@everyone, {interaction.user.mention} ha appena lancianto una votazione, venghino!",
         poll=poll
     )
 
-    thread = await editor.poll_channel.create_thread(
-        name=f"{editor.poll_title} - DISCUSSIONE",
-        message=message
+    thread = await bot.dispatcher.submit(
+        ("thread", editor.poll_channel.id),
+        lambda: editor.poll_channel.create_thread(
+            name=f"{editor.poll_title} - DISCUSSIONE",
+            message=message
+        ),
+        Priority.INTERACTION
     )
-    await thread.send(
+    await bot.dispatcher.send(
+        thread,
+        priority=Priority.INTERACTION,
         content=f"@everyone, questo è il thread ufficiale per discutere la votazione."
     )
 
-    bot.history.register(
+    bot.history(interaction.guild_id).register(
         time=datetime.now(),
         duration=editor.poll_duration,
         quorum=editor.poll_quorum,
@@ -707,11 +1646,41 @@ async def make_poll(interaction: discord.Interaction):
         channel=editor.poll_channel,
         message=message,
         thread=thread,
-        status=POLL_STATUS[0]
+        status=PollStatus.OPEN
     )
+    bot.partitions.schedule(interaction.guild_id)
+    bot.expiry_event.set()
 
     logger.info("New poll registered.")
 
+@bot.tree.command(
+    name="votazione",
+    description="Crea una nuova votazione"
+)
+@discord.app_commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def make_poll(interaction: discord.Interaction):
+
+    poll_channel = await bot.retrieve_channel_from_settings(interaction.guild_id)
+    poll_majority = bot.settings(interaction.guild_id).majority
+    poll_quorum = bot.settings(interaction.guild_id).quorum
+    poll_duration = bot.settings(interaction.guild_id).duration
+        
+    interface = PollInterface(
+        poll_channel=poll_channel,
+        poll_majority=poll_majority,
+        poll_quorum=poll_quorum,
+        poll_duration=poll_duration
+    )
+    editor = PollInterfaceEditor(
+        poll_channel=poll_channel,
+        poll_majority=poll_majority,
+        poll_quorum=poll_quorum,
+        poll_duration=poll_duration
+    )
+
+    await interaction.response.send_message(embed=interface, view=editor, ephemeral=True)
+
 @make_poll.error
 async def make_poll_error(interaction: discord.Interaction, error: Exception):
 
@@ -730,14 +1699,19 @@ class PollHistoryInterface(discord.Embed):
 
     def __init__(
             self,
-            start: int=0,
-            stop: int=MAX_SELECT,
+            guild: int,
+            entries: list | None=None,
             color: int | discord.Colour | None=discord.Color.random()
         ):
         super().__init__(color=color)
 
+        self.guild = guild
+        self.pending = None # poll whose non-voters are still to be filled in by complete()
+        if entries is None:
+            entries = bot.history(self.guild).page_at(limit=MAX_SELECT)
+
         self.set_author(name="Storico votazioni")
-        self.format_history(start, stop)
+        self.format_history(entries)
 
     async def ainit(
         self,
@@ -747,29 +1721,28 @@ class PollHistoryInterface(discord.Embed):
         self.set_author(name="Storico votazioni")
         await self.format_entry(id)
     
-    def format_history(self, start, stop):
+    def format_history(self, entries):
         
         fmt = ""
         
-        i = 0
-        for id, entry in bot.history.database.items():
-            if i>=start and i<stop:
-                fmt += f"Votazione n.{id}: {entry['status']}"+"\n"
-            elif i==stop:
-                break
-
-            i += 1
+        for id, entry in entries:
+            fmt += f"Votazione n.{id}: {entry.status.label}"+"\n"
 
         self.add_field(name="Tutte le votazioni", value=fmt, inline=False)
 
     async def format_entry(self, id):
 
-        poll_entry = await bot.retrieve_entry_from_history(id)
-        users = [user.id for user in bot.get_all_members() if not user.bot]
+        # deleted and closed polls are rendered from the history alone, no api calls
+        entry = bot.history(self.guild).get(id)
+        users = bot.electorate.get(self.guild)
 
-        if poll_entry.status==POLL_STATUS[2]:
+        if entry.status==PollStatus.DELETED:
             self.add_field(name=f"Votazione n.{id}", value="**Votazione eliminata**", inline=False)
+        elif entry.frozen:
+            self.format_frozen_entry(id, entry, users)
         else:
+            poll_entry = await bot.retrieve_entry_from_history(self.guild, id)
+
             display_header = self.format_header_to_display(poll_entry)
             self.add_field(name=f"Votazione n.{id}", value=display_header, inline=False)
 
@@ -779,7 +1752,11 @@ class PollHistoryInterface(discord.Embed):
             display_options = self.format_options_to_display(poll_entry, users)
             self.add_field(name=f"Opzioni di voto", value=display_options, inline=False)
 
-            display_non_voters = await self.format_non_voters_to_display(poll_entry, users)
+            # straight away if the ledger is in sync, otherwise complete() fills it in later
+            display_non_voters = self.format_known_non_voters_to_display(entry.message, users)
+            if display_non_voters is None:
+                display_non_voters = "*caricamento...*"
+                self.pending = id
             self.add_field(name=f"Chi non ha votato?", value=display_non_voters, inline=False)
 
             display_channel = self.format_channel_to_display(poll_entry)
@@ -791,6 +1768,59 @@ class PollHistoryInterface(discord.Embed):
             display_quorum = self.format_quorum_to_display(poll_entry, users)
             self.add_field(name="Quorum", value=display_quorum, inline=True)
 
+    def format_frozen_entry(self, id, entry, users):
+
+        results = entry.results
+        url = f"https://discord.com/channels/{self.guild}/{entry.channel}/{entry.message}"
+
+        # snapshots taken when the poll was closed say when, the older ones only have the expiry
+        closed = results.get("closed")
+        display_closed = f"Chiusa il: {datetime.fromtimestamp(closed).isoformat()}" if closed is not None \
+            else f"Scaduta il: {datetime.fromtimestamp(entry.expires).isoformat()}"
+
+        display_header = f"[Vai alla votazione!]({url})"+"\n" \
+            f"Creata in data: {datetime.fromtimestamp(entry.timestamp).isoformat()}"+"\n" \
+            +display_closed
+        self.add_field(name=f"Votazione n.{id}", value=display_header, inline=False)
+
+        display_title = results["question"]
+        if len(display_title)>EMBED_VALUE_LIMIT:
+            display_title = display_title[:EMBED_VALUE_LIMIT-3]+"..."
+        self.add_field(name="Titolo", value=display_title, inline=False)
+
+        options = []
+        for answer in sorted(results["answers"], key=lambda answer: -answer["votes"]):
+            tmp = f"- [{answer['votes']} voti] {answer['text']}"
+            if answer["majority"]:
+                tmp += " **(maggioranza raggiunta)**"
+
+            options += [tmp]
+
+        display_options = "\n".join(options)
+        if len(display_options)>EMBED_VALUE_LIMIT:
+            single_item_length = EMBED_VALUE_LIMIT//len(options)-6
+            display_options = "\n".join([f"- {option[:single_item_length]}..." for option in options])
+        self.add_field(name="Opzioni di voto", value=display_options, inline=False)
+
+        # the ledger stops changing at closure: trusted if it was ever synced
+        voters = bot.partitions.get(self.guild).ledger.voters(entry.message, 0)
+        if voters is not None:
+            non_voters = sorted(users-voters)
+            display_non_voters = format_mentions(non_voters) if non_voters else "*nessuno*"
+        else:
+            display_non_voters = \
+                f"*{results['eligible']-results['total']} membri su {results['eligible']}*"
+        self.add_field(name="Chi non ha votato?", value=display_non_voters, inline=False)
+
+        self.add_field(name="Canale", value=f"<#{entry.channel}>", inline=True)
+
+        self.add_field(name="Soglia di maggioranza", value=f"{entry.majority}%", inline=True)
+
+        display_quorum = f"{entry.quorum}%"
+        if results["quorum"]:
+            display_quorum += " **(quorum raggiunto)**"
+        self.add_field(name="Quorum", value=display_quorum, inline=True)
+
     def format_header_to_display(self, poll_entry):
         
         fmt = f"[Vai alla votazione!]({poll_entry.message.jump_url})"+"\n"
@@ -833,23 +1863,42 @@ class PollHistoryInterface(discord.Embed):
 
         return fmt
     
-    async def format_non_voters_to_display(self, poll_entry, users):
+    async def complete(self):
 
-        non_voters, voters = [], []
-        for option in poll_entry.message.poll.answers:
-            async for voter in option.voters():
-                voters.append(voter.id)
+        # the slow part of the detail: the voters, paged over the api unless already synced
+        users = bot.electorate.get(self.guild)
+        display_non_voters = await self.format_non_voters_to_display(self.pending, users)
+
+        self.set_non_voters(display_non_voters)
+
+    def fail(self):
+
+        self.set_non_voters("*non disponibile, riprova più tardi*")
+
+    def set_non_voters(self, value: str):
+
+        index = [field.name for field in self.fields].index("Chi non ha votato?")
+        self.set_field_at(index, name="Chi non ha votato?", value=value, inline=False)
+        self.pending = None
+
+    def format_known_non_voters_to_display(self, message, users):
+
+        voters = bot.partitions.get(self.guild).ledger.voters(message, bot.connected_at(self.guild))
+        if voters is None:
+            return None
+
+        non_voters = sorted(users-voters)
 
-        for user in users:
-            if user not in voters:
-                non_voters.append(user)
+        fmt = format_mentions(non_voters) if non_voters else "*nessuno*"
 
-        mentions = []
-        for user in non_voters:
-            tmp = await bot.fetch_user(user)
-            mentions.append(tmp.mention)
+        return fmt
+
+    async def format_non_voters_to_display(self, id, users):
 
-        fmt = ", ".join(mentions)
+        voters = await bot.retrieve_voters(self.guild, id)
+        non_voters = sorted(users-voters)
+
+        fmt = format_mentions(non_voters) if non_voters else "*nessuno*"
 
         return fmt
     
@@ -874,26 +1923,73 @@ class PollHistoryInterface(discord.Embed):
         return fmt
 
 
-class PollHistoryInterfaceEditor(ui.View):
+class PollHistoryInterfaceEditor(PersistentView, kind="gestisci"):
+
+    # restored on the page it showed, the selection for the bulk actions is lost
 
     def __init__(
         self, 
         *,
-        timeout: float | None=None
+        timeout: float | None=VIEW_IDLE,
+        guild: int,
+        page: str | None=None
     ):
         super().__init__(timeout=timeout)
 
-        self.start = 0
-        self.sstop = MAX_SELECT
+        self.guild = guild
+        self.selected = set() # ids picked for the bulk actions, across pages
+
+        # the current page, paging moves from its first/last id so every click costs
+        # O(MAX_SELECT) however deep into the history it is
+        self.entries = bot.history(self.guild).page_at(page, limit=MAX_SELECT)
 
         self.refresh()
 
+    def state(self):
+
+        return self.entries[0][0] if self.entries else ""
+
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, state: str):
+
+        return cls(guild=interaction.guild_id, page=state or None)
+
     def update_interface(self):
 
-        interface = PollHistoryInterface(
-            start=self.start,
-            stop=self.sstop
+        # statuses may have changed since the page was loaded
+        history = bot.history(self.guild)
+        if self.entries:
+            self.entries = history.page_at(self.entries[0][0], limit=MAX_SELECT)
+
+        key = ("page", self.guild, self.entries[0][0] if self.entries else None, history.version)
+        interface = bot.renders.get(key)
+        if interface is None:
+            interface = bot.renders.store(key, PollHistoryInterface(self.guild, entries=self.entries))
+
+        return interface
+
+    async def entry_interface(self, id: str):
+
+        # taken before rendering: votes coming in while it renders make the next render miss
+        partition = bot.partitions.get(self.guild)
+        key = (
+            "poll",
+            self.guild,
+            id,
+            partition.history.version,
+            partition.ledger.version(partition.history.get(id).message),
+            bot.electorate.version(self.guild),
+            bot.connected_at(self.guild)
         )
+        interface = bot.renders.get(key)
+        if interface is None:
+            interface = PollHistoryInterface(self.guild, entries=[])
+            await interface.ainit(id)
+
+            # a render still waiting for its voters isn't cached, the sync it waits for
+            # changes the votes version anyway
+            if interface.pending is None:
+                bot.renders.store(key, interface)
 
         return interface
     
@@ -901,42 +1997,115 @@ class PollHistoryInterfaceEditor(ui.View):
 
         for child in self.children:
             if isinstance(child, ui.Select):
-                if child.placeholder=="Seleziona votazione":
+                if child.placeholder in ["Seleziona votazione", "Seleziona più votazioni"]:
                     self.remove_item(child)
 
             if isinstance(child, ui.Button):
                 if child.label=="Precedente":
-                    if self.start>0:
+                    if self.entries and bot.history(self.guild).has_before(self.entries[0][0]):
                         child.disabled = False
                     else:
                         child.disabled = True
                 
-                if child.label=="Successivo":
-                    if self.sstop<len(bot.history.database):
+                if child.label=="Successivo" or child.label=="Ultima":
+                    if self.entries and bot.history(self.guild).has_after(self.entries[-1][0]):
                         child.disabled = False
                     else:
                         child.disabled = True
+
+                if child.label in ["Chiudi selezionate", "Elimina selezionate", "Esporta selezionate"]:
+                    child.disabled = not self.selected
         
         self.make_select()
+        self.make_multi_select()
     
     def make_select(self):
 
         self.select_poll = ui.Select(placeholder="Seleziona votazione", row=1)
         self.select_poll.callback = self.on_poll_select
 
-        i = 0
-        for id in bot.history.database:
-            if i>=self.start and i<self.sstop:
-                self.select_poll.add_option(
-                    label=f"Votazione n.{id}",
-                    value=id
-                )
-            elif i==self.sstop:
-                break
+        for id, _ in self.entries:
+            self.select_poll.add_option(
+                label=f"Votazione n.{id}",
+                value=id
+            )
+
+        self.add_item(self.select_poll)
+
+    def make_multi_select(self):
+
+        self.select_polls = ui.Select(
+            placeholder="Seleziona più votazioni",
+            min_values=0,
+            max_values=max(len(self.entries), 1),
+            row=3
+        )
+        self.select_polls.callback = self.on_polls_select
+
+        for id, _ in self.entries:
+            self.select_polls.add_option(
+                label=f"Votazione n.{id}",
+                value=id,
+                default=id in self.selected
+            )
+
+        self.add_item(self.select_polls)
+
+    async def on_polls_select(self, interaction: discord.Interaction):
+
+        await interaction.response.defer()
+
+        # the selection of the other pages is kept
+        self.selected -= {id for id, _ in self.entries}
+        self.selected |= set(self.select_polls.values)
+        self.refresh()
+
+        await interaction.edit_original_response(
+            content=f"{len(self.selected)} votazioni selezionate.",
+            embed=self.update_interface(),
+            view=self
+        )
+
+    async def run_bulk(self, interaction: discord.Interaction, title: str, action, statuses: list):
+
+        history = bot.history(self.guild)
+        ids = sorted(
+            [id for id in self.selected if history.get(id).status in statuses], key=int
+        )
+        skipped = len(self.selected)-len(ids)
+
+        for child in self.children:
+            child.disabled = True
+
+        last = 0.0
+        async def progress(done: int, failed: list):
+
+            nonlocal last
+            if done<len(ids) and time.monotonic()-last<BULK_PROGRESS_EVERY:
+                return
+
+            last = time.monotonic()
+            await interaction.edit_original_response(
+                content=None,
+                embed=PollBulkInterface(title, done, len(ids), failed, skipped),
+                view=self
+            )
+
+        await progress(0, [])
+        failed = await bot.bulk(self.guild, ids, action, progress)
 
-            i += 1
+        self.selected.clear()
+        self.refresh()
+        for child in self.children:
+            if isinstance(child, ui.Select) or child.label in ["Vai a...", "Cancella"]:
+                child.disabled = False
 
-        self.add_item(self.select_poll)
+        await interaction.edit_original_response(
+            content=f"{title}: {len(ids)-len(failed)} votazioni completate, {len(failed)} errori,"
+            f" {skipped} saltate.",
+            embed=self.update_interface(),
+            view=self
+        )
 
     async def on_poll_select(self, interaction: discord.Interaction):
 
@@ -944,22 +2113,24 @@ class PollHistoryInterfaceEditor(ui.View):
 
         poll_id = self.select_poll.values[0]
         
-        interface = self.update_interface()
-        await interface.ainit(poll_id)
+        interface = await self.entry_interface(poll_id)
+        editor = PollHistoryEntryInterfaceEditor(id=poll_id, stack=self)
 
         await interaction.edit_original_response(
             embed=interface,
-            view=PollHistoryEntryInterfaceEditor(id=poll_id, stack=self),
+            view=editor,
             allowed_mentions=discord.AllowedMentions(users=False)
         )
 
+        if interface.pending is not None:
+            editor.load(interaction, interface)
+
     @ui.button(label="Precedente", style=discord.ButtonStyle.secondary, row=0)
     async def previous(self, interaction: discord.Interaction, button: ui.Button):
 
         await interaction.response.defer()
 
-        self.start -= MAX_SELECT
-        self.sstop -= MAX_SELECT
+        self.entries = bot.history(self.guild).page_before(self.entries[0][0], limit=MAX_SELECT)
         self.refresh()
         
         await interaction.edit_original_response(embed=self.update_interface(), view=self)
@@ -969,12 +2140,65 @@ class PollHistoryInterfaceEditor(ui.View):
 
         await interaction.response.defer()
 
-        self.start += MAX_SELECT
-        self.sstop += MAX_SELECT
+        self.entries = bot.history(self.guild).page_after(self.entries[-1][0], limit=MAX_SELECT)
+        self.refresh()
+        
+        await interaction.edit_original_response(embed=self.update_interface(), view=self)
+
+    @ui.button(label="Ultima", style=discord.ButtonStyle.secondary, row=0)
+    async def last(self, interaction: discord.Interaction, button: ui.Button):
+
+        await interaction.response.defer()
+
+        self.entries = bot.history(self.guild).page_last(limit=MAX_SELECT)
+        self.refresh()
+        
+        await interaction.edit_original_response(embed=self.update_interface(), view=self)
+
+    @ui.button(label="Vai a...", style=discord.ButtonStyle.secondary, row=0)
+    async def jump(self, interaction: discord.Interaction, button: ui.Button):
+
+        modal = PollModal("Vai alla votazione", is_id=True)
+        await interaction.response.send_modal(modal)
+        if await modal.wait():
+            return
+
+        try:
+            entries = bot.history(self.guild).page_at(str(int(modal.value)), limit=MAX_SELECT)
+        except ValueError:
+            entries = self.entries
+
+        # past the last id: show the last page
+        self.entries = entries or bot.history(self.guild).page_last(limit=MAX_SELECT)
         self.refresh()
         
         await interaction.edit_original_response(embed=self.update_interface(), view=self)
 
+    @ui.button(label="Chiudi selezionate", style=discord.ButtonStyle.red, disabled=True, row=2)
+    async def close_selected(self, interaction: discord.Interaction, button: ui.Button):
+
+        await interaction.response.defer()
+
+        await self.run_bulk(interaction, "Chiusura", bot.close_poll, [PollStatus.OPEN])
+
+    @ui.button(label="Elimina selezionate", style=discord.ButtonStyle.red, disabled=True, row=2)
+    async def delete_selected(self, interaction: discord.Interaction, button: ui.Button):
+
+        await interaction.response.defer()
+
+        await self.run_bulk(
+            interaction, "Eliminazione", bot.delete_poll, [PollStatus.OPEN, PollStatus.CLOSED]
+        )
+
+    @ui.button(label="Esporta selezionate", style=discord.ButtonStyle.primary, disabled=True, row=2)
+    async def export_selected(self, interaction: discord.Interaction, button: ui.Button):
+
+        await interaction.response.defer()
+
+        await self.run_bulk(
+            interaction, "Esportazione", _export, [PollStatus.OPEN, PollStatus.CLOSED]
+        )
+
     @ui.button(label="Cancella", style=discord.ButtonStyle.red, row=2)
     async def cancel(self, interaction: discord.Interaction, button: ui.Button):
         
@@ -989,12 +2213,52 @@ class PollHistoryInterfaceEditor(ui.View):
         self.stop()
 
 
-class PollHistoryEntryInterfaceEditor(ui.View):
+class PollBulkInterface(discord.Embed):
+
+    def __init__(
+            self,
+            title: str,
+            done: int,
+            total: int,
+            failed: list,
+            skipped: int,
+            color: int | discord.Colour | None=discord.Color.random()
+        ):
+        super().__init__(color=color)
+
+        self.set_author(name=f"{title} delle votazioni selezionate")
+
+        display_progress = self.format_progress_to_display(done, total)
+        self.add_field(name="Avanzamento", value=display_progress, inline=False)
+
+        display_failed = self.format_failed_to_display(failed)
+        self.add_field(name="Errori", value=display_failed, inline=True)
+
+        self.add_field(name="Saltate", value=str(skipped), inline=True)
+
+    def format_progress_to_display(self, done, total):
+
+        filled = 20*done//total if total else 20
+        fmt = f"`[{'#'*filled}{'-'*(20-filled)}]` {done}/{total}"
+
+        return fmt
+    
+    def format_failed_to_display(self, failed):
+
+        fmt = ", ".join(f"n.{id}" for id in sorted(failed, key=int)) if failed else "*nessuno*"
+
+        if len(fmt)>EMBED_VALUE_LIMIT:
+            fmt = fmt[:EMBED_VALUE_LIMIT-3]+"..."
+
+        return fmt
+
+
+class PollHistoryEntryInterfaceEditor(PersistentView, kind="gestisci-voto"):
 
     def __init__(
         self, 
         *,
-        timeout: float | None=None,
+        timeout: float | None=VIEW_IDLE,
         id: str | None=None,
         stack: PollHistoryInterfaceEditor | None=None
     ):
@@ -1002,19 +2266,67 @@ class PollHistoryEntryInterfaceEditor(ui.View):
 
         self.id = id
         self.stack = stack
+        self.loading = None # follow-up edit filling in the slow fields of the detail
 
         self.check_status()
 
+    def load(self, interaction: discord.Interaction, interface: PollHistoryInterface):
+
+        self.loading = asyncio.create_task(self.complete(interaction, interface))
+
+    async def complete(self, interaction: discord.Interaction, interface: PollHistoryInterface):
+
+        try:
+            await interface.complete()
+        except Exception as e:
+            logger.exception(e)
+            interface.fail()
+
+        try:
+            await interaction.edit_original_response(
+                embed=interface,
+                allowed_mentions=discord.AllowedMentions(users=False)
+            )
+        except Exception as e:
+            logger.exception(e)
+
+    def cancel_loading(self):
+
+        # the user moved on: the voters and the edit aren't needed anymore
+        if self.loading is not None:
+            self.loading.cancel()
+
+    async def on_timeout(self):
+
+        self.cancel_loading()
+        await super().on_timeout()
+
+    def state(self):
+
+        # the poll, then the page to go back to
+        return f"{self.id}.{self.stack.state()}"
+
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, state: str):
+
+        id, _, page = state.partition(".")
+        if bot.history(interaction.guild_id).get(id) is None:
+            return None
+
+        stack = PollHistoryInterfaceEditor(guild=interaction.guild_id, page=page or None)
+
+        return cls(id=id, stack=stack)
+
     def check_status(self):
 
-        poll_entry = bot.history.database[self.id]
+        poll_entry = bot.history(self.stack.guild).get(self.id)
         
         for child in self.children:
             if isinstance(child, ui.Button):
-                if poll_entry["status"]==POLL_STATUS[1]:
+                if poll_entry.status==PollStatus.CLOSED:
                     if child.label=="Pinga non-votanti" or child.label=="Chiudi votazione":
                         child.disabled = True
-                elif poll_entry["status"]==POLL_STATUS[2]:
+                elif poll_entry.status==PollStatus.DELETED:
                     child.disabled = True
 
     @ui.button(label="Pinga non-votanti", style=discord.ButtonStyle.primary, row=0)
@@ -1022,26 +2334,29 @@ class PollHistoryEntryInterfaceEditor(ui.View):
 
         await interaction.response.defer()
 
-        await _ping(self.id)
+        await _ping(self.stack.guild, self.id)
 
     @ui.button(label="Esporta risultati", style=discord.ButtonStyle.primary, row=0)
     async def export_poll(self, interaction: discord.Interaction, button: ui.Button):
 
         await interaction.response.defer()
 
-        await _export(self.id)
+        await _export(self.stack.guild, self.id)
+
+    @ui.button(label="Esporta voti", style=discord.ButtonStyle.primary, row=0)
+    async def export_ballots(self, interaction: discord.Interaction, button: ui.Button):
+
+        await interaction.response.defer()
+
+        await _export(self.stack.guild, self.id, ballots=True)
 
     @ui.button(label="Chiudi votazione", style=discord.ButtonStyle.red, row=1)
     async def close_poll(self, interaction: discord.Interaction, button: ui.Button):
 
+        self.cancel_loading()
         await interaction.response.defer()
         
-        poll_entry = await bot.retrieve_entry_from_history(self.id)
-        await poll_entry.message.poll.end()
-        message = await poll_entry.thread.send(content="La votazione è stata terminata.")
-        await message.pin()
-
-        bot.history.update(id=self.id, status=1)
+        await bot.close_poll(self.stack.guild, self.id)
 
         await interaction.edit_original_response(
             embed=self.stack.update_interface(),
@@ -1051,13 +2366,10 @@ class PollHistoryEntryInterfaceEditor(ui.View):
     @ui.button(label="Elimina votazione", style=discord.ButtonStyle.red, row=1)
     async def delete_poll(self, interaction: discord.Interaction, button: ui.Button):
 
+        self.cancel_loading()
         await interaction.response.defer()
         
-        poll_entry = await bot.retrieve_entry_from_history(self.id)
-        await poll_entry.thread.delete()
-        await poll_entry.message.delete()
-
-        bot.history.update(id=self.id, status=2)
+        await bot.delete_poll(self.stack.guild, self.id)
 
         await interaction.edit_original_response(
             embed=self.stack.update_interface(),
@@ -1067,6 +2379,7 @@ class PollHistoryEntryInterfaceEditor(ui.View):
     @ui.button(label="Indietro", style=discord.ButtonStyle.secondary, row=2)
     async def back(self, interaction: discord.Interaction, button: ui.Button):
 
+        self.cancel_loading()
         await interaction.response.defer()
         
         await interaction.edit_original_response(
@@ -1080,26 +2393,22 @@ class PollHistoryEntryInterfaceEditor(ui.View):
     description= \
         "Permette di gestire le singole votazioni.",
 )
+@discord.app_commands.guild_only()
 @commands.has_permissions(administrator=True)
 async def manage_polls(interaction: discord.Interaction):
     
-    if len(bot.history.database)==0:
+    if len(bot.history(interaction.guild_id))==0:
         await interaction.response.send_message(
             "Non ci sono votazioni da gestire!",
             ephemeral=True
         )
 
         return
-
-    bot.history.update()
     
-    interface = PollHistoryInterface()
-    editor = PollHistoryInterfaceEditor()
+    editor = PollHistoryInterfaceEditor(guild=interaction.guild_id)
+    interface = editor.update_interface()
 
     await interaction.response.send_message(embed=interface, view=editor, ephemeral=True)
-    await editor.wait()
-
-    bot.history.dump()
     
 @manage_polls.error
 async def manage_polls_error(interaction: discord.Interaction, error: Exception):
@@ -1195,12 +2504,14 @@ class PollSettingsInterface(discord.Embed):
         return fmt
         
 
-class PollSettingsInterfaceEditor(ui.View):
+class PollSettingsInterfaceEditor(PersistentView, kind="impostazioni"):
+
+    # restored from the saved settings, edits that weren't confirmed are lost
 
     def __init__(
         self, 
         *,
-        timeout: float | None=None, 
+        timeout: float | None=VIEW_IDLE, 
         poll_channel: discord.TextChannel | None=None,
         poll_majority: int | None=None,
         poll_quorum: int | None=None,
@@ -1219,6 +2530,18 @@ class PollSettingsInterfaceEditor(ui.View):
         self.select_channel.callback = self.on_channel_select
         self.add_item(self.select_channel)
 
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, state: str):
+
+        settings = bot.settings(interaction.guild_id)
+
+        return cls(
+            poll_channel=await bot.retrieve_channel_from_settings(interaction.guild_id),
+            poll_majority=settings.majority,
+            poll_quorum=settings.quorum,
+            poll_duration=settings.duration
+        )
+
     def update_interface(self):
 
         interface = PollSettingsInterface(
@@ -1232,7 +2555,7 @@ class PollSettingsInterfaceEditor(ui.View):
     
     async def on_channel_select(self, interaction: discord.Interaction):
 
-        self.poll_channel = await bot.fetch_channel(self.select_channel.values[0].id)
+        self.poll_channel = await bot.resolver.channel(self.select_channel.values[0].id)
         await interaction.response.defer()
         
         self.enable_send()
@@ -1243,7 +2566,8 @@ class PollSettingsInterfaceEditor(ui.View):
 
         modal = PollModal("Maggioranza", default=self.poll_majority, is_majority=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_majority = modal.value
 
@@ -1255,7 +2579,8 @@ class PollSettingsInterfaceEditor(ui.View):
 
         modal = PollModal("Quorum", default=self.poll_quorum, is_quorum=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_quorum = modal.value
 
@@ -1267,7 +2592,8 @@ class PollSettingsInterfaceEditor(ui.View):
 
         modal = PollModal("Durata", default=self.poll_duration, is_duration=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.poll_duration = modal.value
 
@@ -1324,6 +2650,13 @@ class PollSettingsInterfaceEditor(ui.View):
 
         self.stop()
 
+        settings = bot.settings(interaction.guild_id)
+        settings.channel = self.poll_channel
+        settings.majority = self.poll_majority
+        settings.quorum = self.poll_quorum
+        settings.duration = self.poll_duration
+        settings.dump()
+
     @ui.button(label="Cancella", style=discord.ButtonStyle.red, row=2)
     async def cancel(self, interaction: discord.Interaction, button: ui.Button):
         
@@ -1345,13 +2678,14 @@ class PollSettingsInterfaceEditor(ui.View):
     description= \
         "Mostra/modifica le impostazioni per le votazioni."
 )
+@discord.app_commands.guild_only()
 @commands.has_permissions(administrator=True)
 async def make_settings(interaction: discord.Interaction):
     
-    poll_channel = await bot.retrieve_channel_from_settings()
-    poll_majority = bot.settings.majority
-    poll_quorum = bot.settings.quorum
-    poll_duration = bot.settings.duration
+    poll_channel = await bot.retrieve_channel_from_settings(interaction.guild_id)
+    poll_majority = bot.settings(interaction.guild_id).majority
+    poll_quorum = bot.settings(interaction.guild_id).quorum
+    poll_duration = bot.settings(interaction.guild_id).duration
         
     interface = PollSettingsInterface(
         poll_channel=poll_channel,
@@ -1367,16 +2701,6 @@ async def make_settings(interaction: discord.Interaction):
     )
 
     await interaction.response.send_message(embed=interface, view=editor, ephemeral=True)
-    await editor.wait()
-
-    if editor.is_cancelled:
-        return
-    
-    bot.settings.channel = editor.poll_channel
-    bot.settings.majority = editor.poll_majority
-    bot.settings.quorum = editor.poll_quorum
-    bot.settings.duration = editor.poll_duration
-    bot.settings.dump()
 
 @make_settings.error
 async def make_settings_error(interaction: discord.Interaction, error: Exception):
@@ -1392,21 +2716,26 @@ async def make_settings_error(interaction: discord.Interaction, error: Exception
 
 #region command: RESET
 
-class ResetView(ui.View):
+class ResetView(PersistentView, kind="reset"):
 
     def __init__(
         self, 
         *,
-        timeout: float | None=None,
+        timeout: float | None=VIEW_IDLE,
     ):
         super().__init__(timeout=timeout)
 
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, state: str):
+
+        return cls()
+
     @ui.button(label="Conferma", style=discord.ButtonStyle.green, row=0)
     async def send(self, interaction: discord.Interaction, button: ui.Button):
         
         await interaction.response.defer()
 
-        bot.reset()
+        bot.reset(interaction.guild_id)
 
         await interaction.edit_original_response(
             content="I dati sono stati eliminati.",
@@ -1435,6 +2764,7 @@ class ResetView(ui.View):
     description= \
         "Cancella storico e impostazioni delle votazioni"
 )
+@discord.app_commands.guild_only()
 @commands.has_permissions(administrator=True)
 async def reset_bot(interaction: discord.Interaction):
         
@@ -1445,7 +2775,6 @@ async def reset_bot(interaction: discord.Interaction):
         view=view,
         ephemeral=True
     )
-    await view.wait()
 
 @reset_bot.error
 async def reset_bot_error(interaction: discord.Interaction, error: Exception):
@@ -1467,17 +2796,18 @@ async def reset_bot_error(interaction: discord.Interaction, error: Exception):
         "Da usare nel thread di discussione: "
         "restituisce l'ID della votazione",
 )
+@discord.app_commands.guild_only()
 @commands.has_permissions(administrator=True)
 async def get_poll_id(interaction: discord.Interaction):
     
-    for id, entry in bot.history.database.items():
-        if entry["thread"]==interaction.channel.id:
-            await interaction.response.send_message(
-                f"L'ID della votazione corrente è: {id}",
-                ephemeral=True
-            )
+    id = bot.history(interaction.guild_id).find_by_thread(interaction.channel.id)
+    if id is not None:
+        await interaction.response.send_message(
+            f"L'ID della votazione corrente è: {id}",
+            ephemeral=True
+        )
 
-            return
+        return
 
     await interaction.response.send_message(
         "Puoi usare questo comando solo nel thread dedicato ad una votazione!",
@@ -1498,27 +2828,16 @@ async def ping_remaining_error(interaction: discord.Interaction, error: Exceptio
 
 #region command: PINGA
 
-async def _ping(id: str):
-
-    poll_entry = await bot.retrieve_entry_from_history(id)
-    users = [user.id for user in bot.get_all_members() if not user.bot]
-
-    non_voters, voters = [], []
-    for option in poll_entry.message.poll.answers:
-        async for voter in option.voters():
-            voters.append(voter.id)
+async def _ping(guild: int, id: str):
 
-    for user in users:
-        if user not in voters:
-            non_voters.append(user)
+    poll_entry = await bot.retrieve_entry_from_history(guild, id)
+    users = bot.electorate.get(guild)
 
-    mentions = []
-    for user in non_voters:
-        tmp = await bot.fetch_user(user)
-        mentions.append(tmp.mention)
+    voters = await bot.retrieve_voters(guild, id)
+    non_voters = sorted(users-voters)
 
-    content = ", ".join(mentions)+" è stato richiesto il vostro voto!"
-    await poll_entry.thread.send(content=content)
+    for content in chunk_mentions(non_voters, suffix=" è stato richiesto il vostro voto!"):
+        await bot.dispatcher.send(poll_entry.thread, priority=Priority.PING, content=content)
 
 @bot.tree.command(
     name="pinga",
@@ -1526,17 +2845,27 @@ async def _ping(id: str):
         "Da usare nel thread di discussione: "
         "richiama gli utenti che non hanno ancora votato",
 )
+@discord.app_commands.guild_only()
 @commands.has_permissions(administrator=True)
 async def ping_remaining(interaction: discord.Interaction):
     
-    for id, entry in bot.history.database.items():
-        if entry["thread"]==interaction.channel.id:
-            if entry["status"]==POLL_STATUS[0]:
-                await _ping(id)
+    # the voters may have to be crawled and the mentions wait their turn in the dispatcher,
+    # well past the 3 seconds discord gives to an answer
+    await interaction.response.defer(ephemeral=True)
 
-                return
+    history = bot.history(interaction.guild_id)
+    id = history.find_by_thread(interaction.channel.id)
+    if id is not None and history.get(id).status==PollStatus.OPEN:
+        await _ping(interaction.guild_id, id)
+
+        await interaction.followup.send(
+            "Ho richiamato gli utenti che non hanno ancora votato!",
+            ephemeral=True
+        )
+
+        return
     
-    await interaction.response.send_message(
+    await interaction.followup.send(
         "Puoi usare questo comando solo nel thread dedicato ad una votazione aperta!",
         ephemeral=True
     )
@@ -1546,7 +2875,10 @@ async def ping_remaining_error(interaction: discord.Interaction, error: Exceptio
 
     logger.exception(error)
 
-    await interaction.response.send_message(
+    # the command defers before the voters are retrieved
+    send = interaction.followup.send if interaction.response.is_done() \
+        else interaction.response.send_message
+    await send(
         "Uh oh! Qualcosa è andato storto! Controlla i file di log per maggiori informazioni",
         ephemeral=True
     )
@@ -1555,38 +2887,60 @@ async def ping_remaining_error(interaction: discord.Interaction, error: Exceptio
 
 #region command: ESPORTA
     
-async def _export(id):
-    
-    poll_entry = await bot.retrieve_entry_from_history(id)
-    users = [user.id for user in bot.get_all_members() if not user.bot]
+def _csv_spool():
 
-    filename = f"{bot.path}/poll_{id}_{poll_entry.message.poll.question.replace(' ', '-')}.csv"
-    with open(filename, "w") as f:
-        f.write("\"OPZIONE\",\"VOTI\",\"MAGGIORANZA\",\"QUORUM\""+"\n")
-        for option in poll_entry.message.poll.answers:
-            if option.vote_count>poll_entry.majority/100*poll_entry.message.poll.total_votes:
-                f.write(f"\"{option.text}\",\"{option.vote_count}\",\"SI\",\"\""+"\n")
-            else:
-                f.write(f"\"{option.text}\",\"{option.vote_count}\",\"NO\",\"\""+"\n")
-            
-        f.write("\"\",\"\",\"\",\"\""+"\n")
-        
-        if poll_entry.message.poll.total_votes>poll_entry.quorum/100*len(users):
-            quorum = "SI"
-        else:
-            quorum = "NO"
-        
-        f.write(
-            f"\"HANNO VOTATO\",\"{poll_entry.message.poll.total_votes}\","
-            f"\"su {len(users)}\",\"{quorum}\""+"\n"
-        )
+    # csv text straight into an anonymous temporary file, gone as soon as it is closed
+    f = tempfile.TemporaryFile("w+", encoding="utf-8", newline="")
 
-    message = await poll_entry.thread.send(
-        content=f"La votazione è stata esportata su file!",
-        file=discord.File(filename)
-    )
+    return f, csv.writer(f)
 
-    await message.pin()
+def _csv_file(f, filename: str):
+
+    # discord reads bytes: the text layer is flushed by the seek, its buffer is sent
+    f.seek(0)
+
+    return discord.File(f.buffer, filename=filename)
+
+async def _export(guild: int, id: str, ballots: bool=False):
+    
+    # the results of a closed poll come from its snapshot, only the ballots need discord
+    entry = bot.history(guild).get(id)
+    if entry.frozen and not ballots:
+        thread = await bot.resolver.channel(entry.thread)
+        results = entry.results
+    else:
+        poll_entry = await bot.retrieve_entry_from_history(guild, id)
+        thread = poll_entry.thread
+        poll = poll_entry.message.poll
+        results = bot.tally(guild, poll_entry, poll)
+
+    f, writer = _csv_spool()
+    if ballots:
+        # one row per voter and answer, written while the voters are paged in
+        writer.writerow(["ID UTENTE", "NOME", "RISPOSTA"])
+        for option in poll.answers:
+            async for voter in option.voters():
+                writer.writerow([voter.id, voter.display_name, option.text])
+    else:
+        writer.writerow(["OPZIONE", "VOTI", "MAGGIORANZA", "QUORUM"])
+        for answer in results["answers"]:
+            majority = "SI" if answer["majority"] else "NO"
+            writer.writerow([answer["text"], answer["votes"], majority, ""])
+
+        writer.writerow(["", "", "", ""])
+
+        quorum = "SI" if results["quorum"] else "NO"
+        writer.writerow(["HANNO VOTATO", results["total"], f"su {results['eligible']}", quorum])
+
+    kind = "voti" if ballots else "poll"
+    with f:
+        message = await bot.dispatcher.send(
+            thread,
+            content="La votazione è stata esportata su file!",
+            file=_csv_file(f, f"{kind}_{id}_{results['question'].replace(' ', '-')}.csv")
+        )
+
+    await bot.dispatcher.pin(message)
 
 @bot.tree.command(
     name="esporta",
@@ -1594,14 +2948,16 @@ async def _export(id):
         "Da usare nel thread di discussione: "
         "esporta i dati di voto su file .csv",
 )
+@discord.app_commands.describe(per_votante="Una riga per ogni votante e la sua risposta")
+@discord.app_commands.guild_only()
 @commands.has_permissions(administrator=True)
-async def export_poll(interaction: discord.Interaction):
+async def export_poll(interaction: discord.Interaction, per_votante: bool=False):
     
-    for id, entry in bot.history.database.items():
-        if entry["thread"]==interaction.channel.id:
-            await _export(id)
+    id = bot.history(interaction.guild_id).find_by_thread(interaction.channel.id)
+    if id is not None:
+        await _export(interaction.guild_id, id, ballots=per_votante)
 
-            return
+        return
     
     await interaction.response.send_message(
         "Puoi usare questo comando solo nel thread dedicato ad una votazione aperta!",
@@ -1620,6 +2976,298 @@ async def export_poll_error(interaction: discord.Interaction, error: Exception):
 
 #endregion
 
+#region command: ESPORTA-STORICO
+
+async def _export_rows(guild: int, id: str, entry):
+
+    # one row per option, the poll metadata repeated on every row
+    poll = {
+        "id": id,
+        "creata": datetime.fromtimestamp(entry.timestamp).isoformat(),
+        "scadenza": datetime.fromtimestamp(entry.expires).isoformat(),
+        "stato": entry.status.label.strip("*"),
+        "canale": entry.channel,
+        "messaggio": entry.message,
+        "thread": entry.thread,
+        "maggioranza": entry.majority,
+        "quorum": entry.quorum
+    }
+
+    if entry.frozen:
+        results = entry.results
+    else:
+        try:
+            channel = bot.resolver.messageable(entry.channel, guild)
+            message = await bot.resolver.message(channel, entry.message)
+        except discord.HTTPException as e:
+            logger.exception(e)
+
+            return [poll]
+
+        results = bot.tally(guild, entry, message.poll)
+
+    return [
+        poll | {
+            "domanda": results["question"],
+            "opzione": answer["text"],
+            "voti": answer["votes"],
+            "voti_totali": results["total"],
+            "maggioranza_raggiunta": answer["majority"]
+        } for answer in results["answers"]
+    ]
+
+def _export_selection(guild: int, start: datetime | None, end: datetime | None):
+
+    # (id, entry) of the polls created in [start, end), walking the history a page at a time
+    page = bot.history(guild).page_at(limit=EXPORT_CONCURRENCY)
+    while page:
+        for id, entry in page:
+            if entry.status==PollStatus.DELETED:
+                continue
+            if start is not None and entry.timestamp<start.timestamp():
+                continue
+            if end is not None and entry.timestamp>=end.timestamp():
+                continue
+
+            yield id, entry
+
+        page = bot.history(guild).page_after(page[-1][0], limit=EXPORT_CONCURRENCY)
+
+async def _export_history(guild: int, format: str, start: datetime | None, end: datetime | None):
+
+    # rows go straight into a zip inside a spooled buffer, EXPORT_CONCURRENCY polls at a time:
+    # memory stays flat however long the history is and nothing is left on disk
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL)
+    count = 0
+
+    with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(f"storico_votazioni.{format}", "w", force_zip64=True) as raw:
+            f = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            if format=="csv":
+                writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+                writer.writeheader()
+
+            selection = _export_selection(guild, start, end)
+            while True:
+                batch = [item for _, item in zip(range(EXPORT_CONCURRENCY), selection)]
+                if not batch:
+                    break
+
+                results = await asyncio.gather(*[
+                    _export_rows(guild, id, entry) for id, entry in batch
+                ])
+                for rows in results:
+                    for row in rows:
+                        if format=="csv":
+                            writer.writerow(row)
+                        else:
+                            f.write(json.dumps(row, ensure_ascii=False)+"\n")
+
+                count += len(batch)
+
+            f.flush()
+            f.detach()
+
+    spool.seek(0)
+
+    return spool, count
+
+@bot.tree.command(
+    name="esporta-storico",
+    description= \
+        "Esporta i risultati di tutte le votazioni (o di un intervallo di date) in un archivio .zip"
+)
+@discord.app_commands.describe(
+    formato="Formato dei dati nell'archivio",
+    dal="Data di inizio, AAAA-MM-GG (compresa)",
+    al="Data di fine, AAAA-MM-GG (compresa)"
+)
+@discord.app_commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def export_history(
+    interaction: discord.Interaction,
+    formato: Literal["csv", "jsonl"]="csv",
+    dal: str | None=None,
+    al: str | None=None
+):
+
+    try:
+        start = datetime.fromisoformat(dal) if dal else None
+        end = datetime.fromisoformat(al)+timedelta(days=1) if al else None
+    except ValueError:
+        await interaction.response.send_message(
+            "Le date vanno scritte nel formato AAAA-MM-GG!",
+            ephemeral=True
+        )
+
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    spool, count = await _export_history(interaction.guild_id, formato, start, end)
+    with spool:
+        if not count:
+            await interaction.followup.send(
+                "Non ci sono votazioni da esportare in questo intervallo!",
+                ephemeral=True
+            )
+
+            return
+
+        await interaction.followup.send(
+            f"{count} votazioni esportate!",
+            file=discord.File(spool, filename="storico_votazioni.zip"),
+            ephemeral=True
+        )
+
+@export_history.error
+async def export_history_error(interaction: discord.Interaction, error: Exception):
+
+    logger.exception(error)
+
+    # the command defers before the export starts
+    send = interaction.followup.send if interaction.response.is_done() \
+        else interaction.response.send_message
+    await send(
+        "Uh oh! Qualcosa è andato storto! Controlla i file di log per maggiori informazioni",
+        ephemeral=True
+    )
+
+#endregion
+
+#region command: STATISTICHE
+
+class PollStatsInterface(discord.Embed):
+
+    def __init__(
+            self,
+            stats: dict,
+            start: datetime | None,
+            end: datetime | None,
+            color: int | discord.Colour | None=discord.Color.random()
+        ):
+        super().__init__(color=color)
+
+        self.set_author(name="Statistiche delle votazioni")
+        self.description = self.format_period_to_display(start, end)
+
+        display_polls = self.format_polls_to_display(stats)
+        self.add_field(name="Votazioni", value=display_polls, inline=False)
+
+        self.add_field(name="Affluenza media", value=self.format_rate(stats["turnout"]), inline=True)
+        self.add_field(
+            name="Maggioranza raggiunta", value=self.format_rate(stats["majority"]), inline=True
+        )
+        self.add_field(name="Quorum raggiunto", value=self.format_rate(stats["quorum"]), inline=True)
+
+        display_participation = self.format_participation_to_display(stats)
+        self.add_field(name="Partecipazione dei membri", value=display_participation, inline=False)
+
+        display_top = self.format_top_to_display(stats)
+        self.add_field(name="I più assidui", value=display_top, inline=False)
+
+    def format_period_to_display(self, start, end):
+
+        if start is None and end is None:
+            return "Tutto lo storico"
+
+        fmt = "Votazioni create"
+        if start is not None:
+            fmt += f" dal {start.date().isoformat()}"
+        if end is not None:
+            fmt += f" al {(end-timedelta(days=1)).date().isoformat()}"
+
+        return fmt
+
+    def format_rate(self, rate):
+
+        fmt = f"{100*rate:.1f}%" if rate is not None else "*non disponibile*"
+
+        return fmt
+
+    def format_polls_to_display(self, stats):
+
+        fmt = f"{stats['polls']} in totale: {stats['open']} aperte, {stats['closed']} chiuse," \
+            f" {stats['deleted']} eliminate"+"\n" \
+            f"Le percentuali si riferiscono alle {stats['final']} votazioni chiuse con risultati salvati"
+
+        return fmt
+
+    def format_participation_to_display(self, stats):
+
+        if stats["participation"] is None:
+            return "*non disponibile*"
+
+        fmt = f"In media ogni membro ha votato il {100*stats['participation']:.1f}% delle" \
+            f" {stats['tracked']} votazioni di cui si conoscono i votanti"+"\n" \
+            f"Membri che non hanno mai votato: {stats['never']}"
+
+        return fmt
+
+    def format_top_to_display(self, stats):
+
+        fmt = "\n".join(f"- <@{user}>: {100*rate:.1f}%" for user, rate in stats["top"])
+
+        return fmt or "*nessuno*"
+
+@bot.tree.command(
+    name="statistiche",
+    description="Mostra le statistiche di tutte le votazioni (o di un intervallo di date)"
+)
+@discord.app_commands.describe(
+    dal="Data di inizio, AAAA-MM-GG (compresa)",
+    al="Data di fine, AAAA-MM-GG (compresa)"
+)
+@discord.app_commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def statistics(interaction: discord.Interaction, dal: str | None=None, al: str | None=None):
+
+    try:
+        start = datetime.fromisoformat(dal) if dal else None
+        end = datetime.fromisoformat(al)+timedelta(days=1) if al else None
+    except ValueError:
+        await interaction.response.send_message(
+            "Le date vanno scritte nel formato AAAA-MM-GG!",
+            ephemeral=True
+        )
+
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    # the history is read into arrays a page at a time, the event loop runs in between;
+    # the vectorized passes over them run on a worker thread
+    guild = interaction.guild_id
+    with bot.partitions.hold(guild) as partition:
+        key = ("columns", guild, partition.history.version, partition.ledger.revision)
+        columns = bot.columns.get(key)
+        if columns is None:
+            columns = bot.columns.store(
+                key, await PollColumns.load_async(partition.history, partition.ledger)
+            )
+    members = set(bot.electorate.get(guild)) # member events keep changing the live set
+    stats = await asyncio.to_thread(poll_stats, columns, members, start, end)
+
+    await interaction.followup.send(
+        embed=PollStatsInterface(stats, start, end),
+        ephemeral=True
+    )
+
+@statistics.error
+async def statistics_error(interaction: discord.Interaction, error: Exception):
+
+    logger.exception(error)
+
+    # the command defers before the statistics are computed
+    send = interaction.followup.send if interaction.response.is_done() \
+        else interaction.response.send_message
+    await send(
+        "Uh oh! Qualcosa è andato storto! Controlla i file di log per maggiori informazioni",
+        ephemeral=True
+    )
+
+#endregion
+
 bot.run(
     token,
     log_handler=handler,
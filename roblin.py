@@ -18,17 +18,22 @@ from discord.ext import tasks, commands
 from discord.utils import get
 from typing import List
 from random import uniform
+from persistence import JsonWriter
+from cluster import ClusterBot, log_file
+from dispatch import Dispatcher
+from views import VIEW_IDLE, PersistentView, ViewRoute
 
 #endregion
 
 #region GLOBALS
 
 CHECK_EVERY = 300 # 5 minutes
+METRICS_EVERY = 15 # minutes between two lines of metrics in the log
 ROLE_ID = 1260315416505614456 # to tag and use with "arruolami"
 
 token = #...
 handler = RotatingFileHandler(
-    filename='discord_roblin.log',
+    filename=log_file('discord_roblin.log'),
     encoding='utf-8',
     mode='a',
     maxBytes=5*1024**2,
@@ -60,6 +65,9 @@ class Settings:
         
         self.load()
 
+        # shared by the processes of a cluster
+        self.writer = JsonWriter(self.f, self.to_dict, merge=self.merge)
+
     def load(self):
 
         if not os.path.exists(self.f):
@@ -75,16 +83,49 @@ class Settings:
             except json.decoder.JSONDecodeError:
                 return {}
 
+    def to_dict(self):
+
+        # links only ever grows by append, copy it so the writer thread never sees it change
+        settings = {key: value for key, value in self.__dict__.items() if key not in ["f", "writer"]}
+        settings["urls"] = list(self.urls)
+        settings["links"] = list(self.links)
+
+        return settings
+
+    def merge(self, current: dict | None, settings: dict):
+
+        # links are only ever appended: the ones another process found meanwhile are kept
+        if current:
+            known = set(settings["links"])
+            settings["links"] += [link for link in current.get("links", []) if link not in known]
+
+        return settings
+
+    def refresh(self):
+
+        # what another process of the cluster saved, unless this one has changes still to write
+        if self.writer.dirty or (self.writer.task is not None and not self.writer.task.done()):
+            return
+
+        for key, value in (self.writer.load() or {}).items():
+            self.__setattr__(key, value)
+
     def dump(self):
 
-        settings = {key: value for key, value in self.__dict__.items() if key!="f"}
-        with open(self.f, "w") as f:
-            json.dump(settings, f, indent=4)
+        self.writer.schedule()
+
+    async def flush(self):
+
+        await self.writer.flush()
+
+    def close(self):
+
+        self.writer.close()
 
 #endregion
 
 
-class RoblinBot(commands.Bot):
+class RoblinBot(ClusterBot):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -95,6 +136,7 @@ class RoblinBot(commands.Bot):
         self.listen_urls = False
         self.interact = False
         self.high_activity = False
+        self.dispatcher = Dispatcher() # outgoing messages and reactions
         
         self.setup()
 
@@ -107,22 +149,71 @@ class RoblinBot(commands.Bot):
     
     def reset(self):
 
+        self.settings.close()
         for f in os.listdir(self.path):
-            os.remove(os.path.join(self.path, f))
+            # the other processes of a cluster may be holding the locks
+            if not f.endswith(".lock"):
+                os.remove(os.path.join(self.path, f))
 
         self.setup()
-    
+
+    async def close(self):
+
+        await self.settings.flush()
+        self.dispatcher.close()
+        await super().close()
+
+    async def setup_hook(self):
+
+        # clicks on menus dropped for idleness or sent before a restart
+        self.add_dynamic_items(ViewRoute)
+
+        self.report_metrics.start()
+
+    @tasks.loop(minutes=METRICS_EVERY)
+    async def report_metrics(self):
+
+        # a line in the log, for whoever is watching the bot under load
+        metrics = {
+            "dispatcher": self.dispatcher.metrics(),
+            "views": PersistentView.gauge()
+        }
+        logger.info(f"Metrics: {json.dumps(metrics)}")
+
+    @report_metrics.before_loop
+    async def before_report_metrics(self):
+
+        await self.wait_until_ready()
+
+    @report_metrics.error
+    async def report_metrics_error(self, error: Exception):
+
+        logger.exception(error)
+
     async def on_ready(self):
         
         print("BOT READY")
 
         try:
-            sync = await bot.tree.sync()
-            print(f"SYNCHED {len(sync)} COMMAND(S)")
+            # the commands are global, in a cluster a single process syncs them
+            if self.primary:
+                sync = await bot.tree.sync()
+                print(f"SYNCHED {len(sync)} COMMAND(S)")
             await self.add_cog(ListenWebsite(self))
         except Exception as e:
             logger.exception(e)
     
+    def announces(self):
+
+        # in a cluster every process runs the checker, only the one with the guild of the
+        # notification channel posts: it's the one that gets the /ascolta of that guild
+        if self.settings.channel is None:
+            return self.primary
+
+        channel = self.get_channel(self.settings.channel)
+
+        return channel is not None and self.owns(channel.guild.id)
+
     async def retrieve_channel_from_settings(self):
 
         if self.settings.channel is not None:
@@ -139,6 +230,11 @@ class ListenWebsite(commands.Cog):
     @tasks.loop(seconds=CHECK_EVERY)
     async def check_for_articles(self):
 
+        # a cluster shares the settings, this also picks up the changes of the other processes
+        bot.settings.refresh()
+        if not bot.announces():
+            return
+
         if not bot.listen_urls:
             # test channel permissions
             try:
@@ -183,8 +279,9 @@ class ListenWebsite(commands.Cog):
                 for link in new_links:
                     channel = await bot.retrieve_channel_from_settings()
                     role = channel.guild.get_role(ROLE_ID)
-                    await channel.send(
-                        f"{role.mention} wake up! New article just dropped: {link}"
+                    await bot.dispatcher.send(
+                        channel,
+                        content=f"{role.mention} wake up! New article just dropped: {link}"
                     )
 
                     bot.settings.links.append(link)
@@ -311,12 +408,14 @@ class SettingsInterface(discord.Embed):
         return fmt
         
 
-class SettingsInterfaceEditor(ui.View):
+class SettingsInterfaceEditor(PersistentView, kind="impostazioni"):
+
+    # restored from the saved settings, edits that weren't confirmed are lost
 
     def __init__(
         self, 
         *,
-        timeout: float | None=None, 
+        timeout: float | None=VIEW_IDLE, 
         channel: discord.TextChannel | None=None,
         urls: List[str] =[],
         probability: int | None=None,
@@ -335,6 +434,18 @@ class SettingsInterfaceEditor(ui.View):
         self.select_channel.callback = self.on_channel_select
         self.add_item(self.select_channel)
 
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, state: str):
+
+        bot.settings.refresh()
+
+        return cls(
+            channel=await bot.retrieve_channel_from_settings(),
+            urls=bot.settings.urls,
+            probability=bot.settings.probability,
+            high_activity_threshold=bot.settings.high_activity_threshold
+        )
+
     def update_interface(self):
 
         interface = SettingsInterface(
@@ -359,7 +470,8 @@ class SettingsInterfaceEditor(ui.View):
 
         modal = SettingsModal("URL", is_url=True)
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.urls.append(modal.value)
         
@@ -384,7 +496,8 @@ class SettingsInterfaceEditor(ui.View):
             is_probability=True
         )
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.probability = modal.value
 
@@ -400,7 +513,8 @@ class SettingsInterfaceEditor(ui.View):
             is_high_activity_threshold=True
         )
         await interaction.response.send_modal(modal)
-        await modal.wait()
+        if await modal.wait():
+            return
 
         self.high_activity_threshold = modal.value
 
@@ -454,6 +568,12 @@ class SettingsInterfaceEditor(ui.View):
 
         self.stop()
 
+        bot.settings.channel = self.channel
+        bot.settings.urls = self.urls
+        bot.settings.probability = self.probability
+        bot.settings.high_activity_threshold = self.high_activity_threshold
+        bot.settings.dump()
+
     @ui.button(label="Cancella", style=discord.ButtonStyle.red, row=2)
     async def cancel(self, interaction: discord.Interaction, button: ui.Button):
         
@@ -480,7 +600,7 @@ class SettingsModal(ui.Modal):
             is_probability: bool=False,
             is_high_activity_threshold: bool=False
         ):
-        super().__init__(title=title)
+        super().__init__(title=title, timeout=VIEW_IDLE)
 
         if is_url:
             self.add_item(
@@ -527,6 +647,7 @@ class SettingsModal(ui.Modal):
 @commands.has_permissions(administrator=True)
 async def make_settings(interaction: discord.Interaction):
     
+    bot.settings.refresh()
     channel = await bot.retrieve_channel_from_settings()
     urls = bot.settings.urls
     probability = bot.settings.probability
@@ -546,16 +667,6 @@ async def make_settings(interaction: discord.Interaction):
     )
 
     await interaction.response.send_message(embed=interface, view=editor, ephemeral=True)
-    await editor.wait()
-
-    if editor.is_cancelled:
-        return
-    
-    bot.settings.channel = editor.channel
-    bot.settings.urls = editor.urls
-    bot.settings.probability = editor.probability
-    bot.settings.high_activity_threshold = editor.high_activity_threshold
-    bot.settings.dump()
 
 @make_settings.error
 async def make_settings_error(interaction: discord.Interaction, error: Exception):
@@ -571,15 +682,20 @@ async def make_settings_error(interaction: discord.Interaction, error: Exception
 
 #region command: RESET
 
-class ResetView(ui.View):
+class ResetView(PersistentView, kind="reset"):
 
     def __init__(
         self, 
         *,
-        timeout: float | None=None,
+        timeout: float | None=VIEW_IDLE,
     ):
         super().__init__(timeout=timeout)
 
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, state: str):
+
+        return cls()
+
     @ui.button(label="Conferma", style=discord.ButtonStyle.green, row=0)
     async def send(self, interaction: discord.Interaction, button: ui.Button):
         
@@ -624,7 +740,6 @@ async def reset_bot(interaction: discord.Interaction):
         view=view,
         ephemeral=True
     )
-    await view.wait()
 
 @reset_bot.error
 async def reset_bot_error(interaction: discord.Interaction, error: Exception):
@@ -775,15 +890,15 @@ async def on_message(message: discord.Message):
         bot.high_activity = False
 
     if message.channel.id==936523898340671548 and message.author.id==159985870458322944:
-        await message.reply(file=discord.File(f"content/IMG_6612.jpg"))
+        await bot.dispatcher.reply(message, file=discord.File(f"content/IMG_6612.jpg"))
 
     probability = uniform(0, 100)
     if bot.high_activity and probability<bot.settings.probability:
         await goblinify(message)
 
     elif len(message.content)>=300 and probability<bot.settings.probability:
-        await message.add_reaction("☝️")
-        await message.add_reaction("🤓")
+        await bot.dispatcher.react(message, "☝️")
+        await bot.dispatcher.react(message, "🤓")
 
     elif any([i in message.content for i in [
         "tetta",
@@ -866,12 +981,13 @@ async def goblinify(message: discord.Message):
 
         for i, chunk in enumerate(goblin_chunks):
             if i==0:
-                await message.reply(chunk)
+                await bot.dispatcher.reply(message, content=chunk)
             else:
-                await message.channel.send(chunk)
+                await bot.dispatcher.send(message.channel, content=chunk)
 
-    await message.channel.send(
-        f"{message.author.mention} gneheh! Sei appena stato"+"\n"
+    await bot.dispatcher.send(
+        message.channel,
+        content=f"{message.author.mention} gneheh! Sei appena stato"+"\n"
         "# <:goblin:1226925141108457604> GOBLINATO <:goblin:1226925141108457604>"
     )
 
@@ -880,7 +996,7 @@ async def call_init(message: discord.Message):
 
     user_ids = [587903981402193920, 948240144828362762]
     mentions = " e ".join([f"<@{user_id}>" for user_id in user_ids])
-    await message.reply(f"Tette menzionate, {mentions} taggate")
+    await bot.dispatcher.reply(message, content=f"Tette menzionate, {mentions} taggate")
 
 async def boobify(message: discord.Message):
 
@@ -894,15 +1010,15 @@ async def boobify(message: discord.Message):
     "ndo di bocciosissime bocciose tettose zinne, vaste titaniche astronomiche divine mostruose e"
     "lefantine angurie mammarie da milkshake podinose tettose lattiere."
     # scusate per quello che avete appena letto...
-    await message.add_reaction("🤏")
-    await message.add_reaction("👅")
-    await message.add_reaction("🫴")
+    await bot.dispatcher.react(message, "🤏")
+    await bot.dispatcher.react(message, "👅")
+    await bot.dispatcher.react(message, "🫴")
 
     probability = uniform(0, 100)
     if probability<5:
-        await message.reply(boob_praise)
+        await bot.dispatcher.reply(message, content=boob_praise)
     else:
-        await message.reply(boob_squeeze)
+        await bot.dispatcher.reply(message, content=boob_squeeze)
 
 #endregion
 
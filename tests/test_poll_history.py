@@ -0,0 +1,186 @@
+#region IMPORTS
+
+import os
+import sys
+import time
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import poll_history
+from poll_history import (
+    PollArchive,
+    PollHistory,
+    PollHistoryEntry,
+    PollHistoryJournal,
+    PollHistorySqlite,
+    PollStatus,
+    open_database
+)
+
+#endregion
+
+def frozen_entry():
+
+    now = int(time.time())
+    entry = PollHistoryEntry(
+        timestamp=now-3600,
+        duration=600,
+        quorum=30,
+        majority=50,
+        channel=1,
+        message=2,
+        thread=3,
+        status=PollStatus.CLOSED,
+        guild=4
+    )
+    entry.results = {
+        "question": "Pizza?",
+        "answers": [{"text": "Sì", "votes": 3, "majority": True}],
+        "total": 3,
+        "eligible": 5,
+        "quorum": True,
+        "closed": now-3000
+    }
+
+    return entry
+
+def open_entry(n: int):
+
+    return PollHistoryEntry(
+        timestamp=int(time.time()),
+        duration=3600,
+        quorum=30,
+        majority=50,
+        channel=1,
+        message=10*n,
+        thread=10*n+1,
+        status=PollStatus.OPEN
+    )
+
+
+class PollTableTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fhistory = os.path.join(self.tmp.name, "poll_history.json")
+        self.farchive = os.path.join(self.tmp.name, "archive")
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def test_reload_keeps_entries_and_lookups(self):
+
+        history = PollHistory(self.fhistory)
+        for n in range(1, 4):
+            history.add(open_entry(n))
+        history.update(id="2", status=PollStatus.DELETED)
+        history.set_results("3", frozen_entry().results)
+        entries = history.page_at(limit=10)
+        history.close()
+
+        history = PollHistory(self.fhistory)
+
+        self.assertEqual(history.page_at(limit=10), entries)
+        self.assertEqual(history.find_by_thread(21), "2")
+        self.assertEqual(history.find_by_message(30), "3")
+        self.assertIsNone(history.find_by_thread(20))
+        self.assertEqual(history.open_polls(), ["1", "3"])
+        self.assertIsNone(history.get("1").guild)
+        history.close()
+
+    def test_unsorted_history_is_paged_in_id_order(self):
+
+        # histories written by older versions kept the insertion order of their polls
+        with open(self.fhistory, "w") as f:
+            json.dump({str(n): open_entry(n).to_dict() for n in [3, 1, 2]}, f, indent=4)
+
+        history = PollHistory(self.fhistory)
+
+        self.assertEqual([id for id, _ in history.page_at(limit=10)], ["1", "2", "3"])
+        self.assertEqual(history.find_by_message(10), "1")
+        history.close()
+
+    def test_journal_replays_archived_polls(self):
+
+        history = PollHistoryJournal(self.fhistory, archive=PollArchive(self.farchive))
+        for n in range(1, 4):
+            history.add(open_entry(n))
+        with history.batch():
+            history.update(id="1", status=PollStatus.CLOSED)
+            history.update(id="2", status=PollStatus.CLOSED)
+        with mock.patch.object(poll_history, "ARCHIVE_SEGMENT_SIZE", 2):
+            archived = asyncio.run(history.archive_closed(-3600))
+        history.close()
+        self.assertEqual(archived, 2)
+
+        history = PollHistoryJournal(self.fhistory, archive=PollArchive(self.farchive))
+
+        self.assertEqual(len(history), 3)
+        self.assertEqual(len(history.database), 1)
+        self.assertEqual(history.find_by_thread(11), "1")
+        self.assertEqual(history.get("2").status, PollStatus.CLOSED)
+        history.close()
+
+
+class SqliteResultsTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fhistory = os.path.join(self.tmp.name, "poll_history.json")
+        self.database = open_database(os.path.join(self.tmp.name, "pollbot.sqlite3"))
+
+    def tearDown(self):
+
+        self.database.close()
+        self.tmp.cleanup()
+
+    def test_restore_keeps_frozen_results(self):
+
+        entry = frozen_entry()
+        history = PollHistorySqlite(self.fhistory, self.database)
+        history.restore([("1", entry)])
+
+        restored = history.get("1")
+        self.assertTrue(restored.frozen)
+        self.assertEqual(restored.results, entry.results)
+
+    def test_json_import_keeps_frozen_results(self):
+
+        entry = frozen_entry()
+        legacy = PollHistoryJournal(self.fhistory)
+        legacy.restore([("1", entry)])
+        legacy.close()
+
+        history = PollHistorySqlite(self.fhistory, self.database)
+
+        restored = history.get("1")
+        self.assertTrue(restored.frozen)
+        self.assertEqual(restored.results, entry.results)
+
+    def test_json_import_keeps_archived_polls(self):
+
+        farchive = os.path.join(self.tmp.name, "archive")
+        legacy = PollHistoryJournal(self.fhistory, archive=PollArchive(farchive))
+        legacy.restore([("1", frozen_entry()), ("2", frozen_entry())])
+        with mock.patch.object(poll_history, "ARCHIVE_SEGMENT_SIZE", 2):
+            archived = asyncio.run(legacy.archive_closed(0))
+        legacy.close()
+        self.assertEqual(archived, 2)
+
+        history = PollHistorySqlite(self.fhistory, self.database, archive=PollArchive(farchive))
+
+        self.assertEqual(len(history), 2)
+        self.assertTrue(history.get("2").frozen)
+
+
+if __name__=="__main__":
+
+    unittest.main()
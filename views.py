@@ -0,0 +1,162 @@
+#region IMPORTS
+
+import secrets
+import logging
+import discord
+from discord import ui
+from collections import Counter
+
+#endregion
+
+#region GLOBALS
+
+VIEW_IDLE = 15*60 # seconds without clicks before a menu is dropped, as long as an interaction token lasts
+
+logger = logging.getLogger("discord")
+
+#endregion
+
+#region VIEWS
+
+class PersistentView(ui.View):
+
+    # menus that outlive their view object. every component gets the custom_id
+    # "kind:session:item:state", state being what the view needs to be rebuilt (a page, a
+    # poll id). discord.py dispatches to a view while it is live, a view idle for VIEW_IDLE
+    # seconds is dropped; a click on a dropped menu, or on one sent before a restart, reaches
+    # ViewRoute instead, which rebuilds the view from its kind and state
+
+    kinds = {} # kind -> view class
+    live = {} # session -> view, every view discord.py can still dispatch to
+    kind = None
+
+    def __init_subclass__(cls, kind: str | None=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if kind is not None:
+            cls.kind = kind
+            PersistentView.kinds[kind] = cls
+
+    def __init__(self, *, timeout: float | None=VIEW_IDLE):
+        super().__init__(timeout=timeout)
+
+        # random, so sessions of a previous run never look live
+        self.session = secrets.token_hex(5)
+
+    def state(self):
+
+        # digits and dots only, whatever restore() needs
+        return ""
+
+    @classmethod
+    async def restore(cls, interaction: discord.Interaction, state: str):
+
+        # a new view in the given state, None if it can't be rebuilt (a draft that was lost)
+        return None
+
+    def find(self, name: str):
+
+        for item in self.children:
+            if self.item_name(item)==name:
+                return item
+
+    def item_name(self, item: ui.Item):
+
+        # decorated items wrap their function, the others have a bound method as callback
+        callback = getattr(item.callback, "callback", item.callback)
+
+        return callback.__name__
+
+    def stamp(self):
+
+        state = self.state()
+        for item in self.children:
+            if item.is_dispatchable():
+                item.custom_id = f"{self.kind}:{self.session}:{self.item_name(item)}:{state}"
+
+    def to_components(self):
+
+        # called by every send/edit that carries the view: that's when it goes live
+        self.stamp()
+        PersistentView.live[self.session] = self
+
+        return super().to_components()
+
+    def stop(self):
+
+        PersistentView.live.pop(self.session, None)
+        super().stop()
+
+    async def on_timeout(self):
+
+        PersistentView.live.pop(self.session, None)
+
+    async def on_error(self, interaction: discord.Interaction, error: Exception, item: ui.Item):
+
+        logger.exception(error)
+
+        send = interaction.followup.send if interaction.response.is_done() \
+            else interaction.response.send_message
+        await send(
+            "Uh oh! Qualcosa è andato storto! Controlla i file di log per maggiori informazioni",
+            ephemeral=True
+        )
+
+    @classmethod
+    def gauge(cls):
+
+        return {
+            "live": len(cls.live),
+            "kinds": dict(Counter(view.kind for view in cls.live.values()))
+        }
+
+
+class ViewRoute(
+    ui.DynamicItem[ui.Item],
+    template=r"(?P<kind>[a-z-]+):(?P<session>[0-9a-f]+):(?P<name>\w+):(?P<state>[0-9.]*)"
+):
+
+    # registered once per bot with add_dynamic_items. discord.py tries it on every click of a
+    # persistent view, live ones included: those are left to the view
+
+    def __init__(self, item: ui.Item, match: dict | None=None) -> None:
+        super().__init__(item)
+
+        self.match = match or {}
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: ui.Item, match):
+
+        return cls(item, match.groupdict())
+
+    async def interaction_check(self, interaction: discord.Interaction):
+
+        return self.match["session"] not in PersistentView.live \
+            and self.match["kind"] in PersistentView.kinds
+
+    async def callback(self, interaction: discord.Interaction):
+
+        view_class = PersistentView.kinds[self.match["kind"]]
+        try:
+            view = await view_class.restore(interaction, self.match["state"])
+        except Exception as e:
+            logger.exception(e)
+            view = None
+
+        item = view.find(self.match["name"]) if view is not None else None
+        if item is None:
+            await interaction.response.send_message(
+                "Questo menu è scaduto, usa di nuovo il comando!",
+                ephemeral=True
+            )
+
+            return
+
+        # select values come with the click
+        item._refresh_state(interaction, interaction.data)
+        try:
+            await item.callback(interaction)
+        except Exception as e:
+            await view.on_error(interaction, e, item)
+
+#endregion